@@ -0,0 +1,268 @@
+import requests
+import httpx
+import asyncio
+import os
+import logging
+import threading
+from typing import Optional, Dict
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "Accept": "*/*",
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Cache-Control": "no-cache"
+}
+
+# 服务端拒绝会话时返回的状态码，遇到时重新登录
+AUTH_FAILURE_STATUS = (401, 403)
+
+class ApiClient:
+    """cloud189-auto-save API 客户端：只登录一次，复用 Cookie、账号 ID 和长连接"""
+
+    def __init__(self, server_url: str, username: str, password: str, timeout: int = 10, pool_size: int = 16):
+        self.server_url = server_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._logged_in = False
+        self._generation = 0
+        self._account_id = None
+
+    def _login(self):
+        """获取初始 Cookie 并登录，失败时抛出 requests 异常"""
+        logger.info("获取初始 Cookie...")
+        response = self.session.get(self.server_url, timeout=self.timeout)
+        response.raise_for_status()
+        logger.info("初始 Cookie 获取成功: %s", self.session.cookies.get_dict())
+
+        logger.info("登录...")
+        login_data = {"username": self.username, "password": self.password}
+        response = self.session.post(f"{self.server_url}/api/auth/login", json=login_data, timeout=self.timeout)
+        response.raise_for_status()
+        logger.info("登录成功: %s", response.json())
+        self._logged_in = True
+        self._generation += 1
+
+    def ensure_login(self) -> int:
+        """确保已登录，返回当前会话代数"""
+        with self._lock:
+            if not self._logged_in:
+                self._login()
+            return self._generation
+
+    def _relogin(self, generation: int):
+        """会话被拒绝时重新登录；若其他线程已重新登录则直接复用"""
+        with self._lock:
+            if self._generation == generation:
+                logger.info("会话已失效，重新登录...")
+                self._logged_in = False
+                self.session.cookies.clear()
+                self._login()
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """发送请求，会话失效时自动重新登录并重试一次"""
+        generation = self.ensure_login()
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.server_url}{path}"
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code in AUTH_FAILURE_STATUS:
+            self._relogin(generation)
+            response = self.session.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def get_account_id(self) -> Optional[str]:
+        """获取并缓存第一个账号的 ID"""
+        if self._account_id:
+            return self._account_id
+        logger.info("获取账号列表...")
+        accounts = self.get("/api/accounts").json()
+        account_id = str(accounts.get("data", [{}])[0].get("id")) if accounts.get("data") else None
+        if account_id:
+            logger.info("使用账号 ID: %s", account_id)
+            self._account_id = account_id
+        return account_id
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> ApiClient:
+    """获取进程内共享的 API 客户端"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ApiClient(
+                os.getenv("SERVER_URL", "http://your-server:3000"),
+                os.getenv("USERNAME", "your_username"),
+                os.getenv("PASSWORD", "your_password"),
+            )
+        return _client
+
+def decode_json(response: httpx.Response):
+    """解析 JSON 响应；响应不是 JSON（如反向代理返回的 HTML 页面）时抛出 httpx.DecodingError
+
+    httpx 的 .json() 抛出的是普通的 json.JSONDecodeError，转换后调用方的 except httpx.HTTPError 即可按请求失败处理。
+    """
+    try:
+        return response.json()
+    except ValueError as e:
+        raise httpx.DecodingError(f"响应不是有效的 JSON (HTTP {response.status_code}): {e}", request=response.request) from e
+
+class AsyncApiClient:
+    """异步版 API 客户端，基于 httpx 连接池，供机器人在事件循环中直接 await"""
+
+    def __init__(self, server_url: str, username: str, password: str, timeout: float = 10, pool_size: int = 16):
+        self.server_url = server_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.client = httpx.AsyncClient(
+            base_url=self.server_url,
+            headers=DEFAULT_HEADERS,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self._lock = None
+        self._logged_in = False
+        self._generation = 0
+        self._account_id = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # 延迟创建，确保锁绑定到运行中的事件循环
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _login(self):
+        """获取初始 Cookie 并登录，失败时抛出 httpx 异常"""
+        logger.info("获取初始 Cookie...")
+        response = await self.client.get("/")
+        response.raise_for_status()
+        logger.info("初始 Cookie 获取成功: %s", dict(self.client.cookies))
+
+        logger.info("登录...")
+        login_data = {"username": self.username, "password": self.password}
+        response = await self.client.post("/api/auth/login", json=login_data)
+        response.raise_for_status()
+        logger.info("登录成功: %s", decode_json(response))
+        self._logged_in = True
+        self._generation += 1
+
+    async def ensure_login(self) -> int:
+        """确保已登录，返回当前会话代数"""
+        async with self._get_lock():
+            if not self._logged_in:
+                await self._login()
+            return self._generation
+
+    async def _relogin(self, generation: int):
+        """会话被拒绝时重新登录；若其他协程已重新登录则直接复用"""
+        async with self._get_lock():
+            if self._generation == generation:
+                logger.info("会话已失效，重新登录...")
+                self._logged_in = False
+                self.client.cookies.clear()
+                await self._login()
+
+    async def request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """发送请求，支持单次请求超时；会话失效时自动重新登录并重试一次"""
+        generation = await self.ensure_login()
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        response = await self.client.request(method, path, **kwargs)
+        if response.status_code in AUTH_FAILURE_STATUS:
+            await self._relogin(generation)
+            response = await self.client.request(method, path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, **kwargs)
+
+    async def get_account_id(self) -> Optional[str]:
+        """获取并缓存第一个账号的 ID"""
+        if self._account_id:
+            return self._account_id
+        logger.info("获取账号列表...")
+        accounts = decode_json(await self.get("/api/accounts"))
+        account_id = str(accounts.get("data", [{}])[0].get("id")) if accounts.get("data") else None
+        if account_id:
+            logger.info("使用账号 ID: %s", account_id)
+            self._account_id = account_id
+        return account_id
+
+    async def list_tasks(self, **kwargs) -> Dict:
+        """GET /api/tasks"""
+        return decode_json(await self.get("/api/tasks", **kwargs))
+
+    async def list_folders(self, account_id: str, folder_id: str = "-11", **kwargs) -> Dict:
+        """GET /api/folders/{account}，列出 folder_id 下的子目录"""
+        return decode_json(await self.get(f"/api/folders/{account_id}", params={"folderId": folder_id}, **kwargs))
+
+    async def parse_share(self, account_id: str, share_link: str, access_code: str = "", **kwargs) -> Dict:
+        """POST /api/share/parse"""
+        payload = {"shareLink": share_link, "accountId": account_id, "accessCode": access_code}
+        return decode_json(await self.post("/api/share/parse", json=payload, **kwargs))
+
+    async def create_task(self, task_data: Dict, **kwargs) -> Dict:
+        """POST /api/tasks"""
+        return decode_json(await self.post("/api/tasks", json=task_data, **kwargs))
+
+    async def execute_task(self, task_id: str, **kwargs) -> Dict:
+        """POST /api/tasks/{id}/execute"""
+        return decode_json(await self.post(f"/api/tasks/{task_id}/execute", **kwargs))
+
+    async def execute_all(self, **kwargs) -> Dict:
+        """POST /api/tasks/executeAll"""
+        return decode_json(await self.post("/api/tasks/executeAll", **kwargs))
+
+    async def delete_task(self, task_id: str, delete_cloud: bool, **kwargs) -> Dict:
+        """DELETE /api/tasks/{id}"""
+        return decode_json(await self.delete(f"/api/tasks/{task_id}", json={"deleteCloud": delete_cloud}, **kwargs))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_async_client = None
+
+def get_async_client() -> AsyncApiClient:
+    """获取进程内共享的异步 API 客户端"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncApiClient(
+            os.getenv("SERVER_URL", "http://your-server:3000"),
+            os.getenv("USERNAME", "your_username"),
+            os.getenv("PASSWORD", "your_password"),
+        )
+    return _async_client
+
+async def close_async_client():
+    """关闭共享的异步 API 客户端（机器人退出时调用），未创建过时不做任何事"""
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.aclose()
@@ -0,0 +1,69 @@
+"""folder_index.crawl_folders 的基准测试
+
+用一个带固定延迟的假 API 客户端（只实现 list_folders）生成 --fanout 叉、--depth 层的目录树，
+以不同的并发数从根目录完整遍历一遍并写入临时数据库，输出用时和列表请求次数。
+
+    python bench/folder_crawl.py --concurrency 1,4,8 --fanout 4 --depth 3 --latency 0.02
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="yabot-bench-"), "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import folder_index  # noqa: E402
+import storage  # noqa: E402
+
+class FakeFolderClient:
+    """按 fanout/depth 生成目录树，每次 list_folders 等待 latency 秒"""
+
+    def __init__(self, fanout: int, depth: int, latency: float):
+        self.latency = latency
+        self.requests = 0
+        self.children = {"-11": [{"id": "1000", "name": "我的转存"}]}
+        ids = itertools.count(1001)
+        frontier = ["1000"]
+        for _ in range(depth):
+            next_frontier = []
+            for parent in frontier:
+                self.children[parent] = [{"id": str(i), "name": "F%d" % i} for i in itertools.islice(ids, fanout)]
+                next_frontier += [child["id"] for child in self.children[parent]]
+            frontier = next_frontier
+
+    async def list_folders(self, account_id, folder_id="-11", **kwargs):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return {"success": True, "data": self.children.get(folder_id, [])}
+
+def reset_index():
+    with storage.transaction() as cursor:
+        cursor.execute("DELETE FROM root_folders")
+        cursor.execute("INSERT INTO root_folders (name, folder_id, parent_id, path, listed_at) VALUES ('', '-11', '', '', NULL)")
+    folder_index._path_cache.clear()
+
+async def crawl(client, concurrency):
+    return sum([1 async for _ in folder_index.crawl_folders(client, "1", [("-11", "")], concurrency=concurrency)])
+
+def main():
+    parser = argparse.ArgumentParser(description="目录遍历基准测试")
+    parser.add_argument("--concurrency", default="1,4,8", help="要测试的并发数，逗号分隔")
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    storage.migrate()
+    for concurrency in [int(x) for x in args.concurrency.split(",")]:
+        reset_index()
+        client = FakeFolderClient(args.fanout, args.depth, args.latency)
+        start = time.time()
+        folders = asyncio.run(crawl(client, concurrency))
+        seconds = time.time() - start
+        print("concurrency=%-3d 用时 %6.2f 秒  目录 %d 个  列表请求 %d 次" % (concurrency, seconds, folders, client.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""用于基准测试的合成 WebDAV 服务器
+
+/dav/<根目录>/ 下按 --fanout 生成确定性的目录树（例如 16,5,4 表示第一层 16 个目录，每个下面 5 个，再下面 4 个），
+除根目录外每个目录有 --files 个 .mkv 文件，每次 PROPFIND 先等待 --latency 秒模拟网络和网盘延迟。
+只支持 PROPFIND (Depth: 1)，GET 返回累计的 PROPFIND 次数。
+
+    python bench/mock_dav.py --port 8765 --fanout 16,5,4 --files 3 --latency 0.02
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+STAMP = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+def make_handler(fanout, files, latency):
+    counter = {"propfind": 0}
+    lock = threading.Lock()
+
+    def children(path):
+        # /dav/<根目录>/... 中根目录以下的层数
+        depth = len([p for p in path.strip("/").split("/")[2:] if p])
+        dirs = ["d %d" % i for i in range(fanout[depth])] if depth < len(fanout) else []
+        names = ["m %d.mkv" % i for i in range(files)] if depth > 0 else []
+        return dirs, names
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body, content_type="text/plain"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PROPFIND(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            with lock:
+                counter["propfind"] += 1
+            time.sleep(latency)
+            path = unquote(urlsplit(self.path).path)
+            base = path if path.endswith("/") else path + "/"
+            dirs, names = children(base)
+            out = ['<?xml version="1.0"?><D:multistatus xmlns:D="DAV:">']
+            for href, collection in [(base, True)] + [(base + d + "/", True) for d in dirs] + [(base + n, False) for n in names]:
+                out.append(
+                    '<D:response><D:href>%s</D:href><D:propstat><D:prop><D:resourcetype>%s</D:resourcetype>'
+                    '<D:getlastmodified>%s</D:getlastmodified><D:getetag>"%s"</D:getetag></D:prop></D:propstat></D:response>'
+                    % (quote(href), "<D:collection/>" if collection else "", STAMP, abs(hash(href)) % 65536)
+                )
+            out.append("</D:multistatus>")
+            self._reply(207, "".join(out).encode("utf-8"), "application/xml")
+
+        def do_GET(self):
+            self._reply(200, str(counter["propfind"]).encode())
+
+    return Handler
+
+def propfind_count(address: str, timeout: float = 10) -> int:
+    """服务器累计收到的 PROPFIND 次数；服务器尚未启动时等待"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return int(urllib.request.urlopen(address + "/").read())
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+@contextmanager
+def running_server(port: int, fanout: str, files: int, latency: float):
+    """在子进程中启动服务器（不与被测代码争用 GIL），返回其地址"""
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--port", str(port),
+                               "--fanout", fanout, "--files", str(files), "--latency", str(latency)])
+    address = "http://127.0.0.1:%d" % port
+    try:
+        propfind_count(address)
+        yield address
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="合成 WebDAV 服务器")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fanout", default="16,5,4", help="每层子目录数，逗号分隔")
+    parser.add_argument("--files", type=int, default=3, help="每个目录的文件数（根目录除外）")
+    parser.add_argument("--latency", type=float, default=0.02, help="每次 PROPFIND 的延迟（秒）")
+    args = parser.parse_args()
+    fanout = [int(x) for x in args.fanout.split(",")]
+    ThreadingHTTPServer.daemon_threads = True
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(fanout, args.files, args.latency))
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
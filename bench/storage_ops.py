@@ -0,0 +1,72 @@
+"""storage 模块单次数据库操作延迟的基准测试
+
+在临时数据库中写入 --rows 条转存历史，然后对几种常用操作分别测量：
+- 长连接：通过 storage 的线程长连接（WAL、预编译语句缓存）执行，即当前代码路径；
+- 每次新建连接：每次调用都 sqlite3.connect/commit/close，即改用 storage 之前的做法。
+
+    python bench/storage_ops.py --rows 5000 --repeat 500
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="yabot-bench-"), "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import create_task  # noqa: E402
+import folder_index  # noqa: E402
+import storage  # noqa: E402
+import yabot  # noqa: E402
+
+def per_call_connection(sql, params=(), write=False):
+    conn = sqlite3.connect(storage.DB_PATH)
+    try:
+        result = conn.execute(sql, params).fetchall()
+        if write:
+            conn.commit()
+        return result
+    finally:
+        conn.close()
+
+def measure(fn, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库操作延迟基准测试")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    yabot.init_db()
+    for i in range(args.rows):
+        yabot._write_message("u", "c", str(i % 300), "path/%d" % (i % 300), time.time())
+
+    insert_sql = ("INSERT INTO messages (sender, content, timestamp, target_folder_id, target_folder_name) "
+                  "VALUES (?, ?, datetime(?, 'unixepoch'), ?, ?)")
+    cases = [
+        ("写入转存历史",
+         lambda i: yabot._write_message("u", "c", str(i % 300), "path/%d" % (i % 300), time.time()),
+         lambda i: per_call_connection(insert_sql, ("u", "c", time.time(), str(i % 300), "path/%d" % (i % 300)), write=True)),
+        ("按目录 ID 查历史",
+         lambda i: create_task.get_folder_from_history(str(i % 400)),
+         lambda i: per_call_connection("SELECT target_folder_name FROM messages WHERE target_folder_id = ? LIMIT 1", (str(i % 400),))),
+        ("读取默认目录",
+         lambda i: yabot.load_default_folder(),
+         lambda i: per_call_connection("SELECT value FROM settings WHERE key = ?", ("default_folder_id",))),
+        ("标记目录过期",
+         lambda i: folder_index.mark_folder_stale(str(i)),
+         lambda i: per_call_connection("UPDATE root_folders SET listed_at = 0 WHERE folder_id = ? AND listed_at IS NOT NULL", (str(i),), write=True)),
+    ]
+    print("历史记录 %d 条，每项重复 %d 次（微秒/次）" % (args.rows, args.repeat))
+    for name, current, baseline in cases:
+        print("%-10s 长连接 %8.1f   每次新建连接 %8.1f" % (name, measure(current, args.repeat), measure(baseline, args.repeat)))
+
+if __name__ == "__main__":
+    main()
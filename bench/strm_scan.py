@@ -0,0 +1,54 @@
+"""strm4.py WebDAV 遍历的基准测试
+
+启动 bench/mock_dav.py，用 strm4.iter_files 以不同的并发数遍历整个目录树（不写文件、不用清单），
+输出用时、PROPFIND 次数和文件数，并检查每个目录只列一次、文件数与目录结构一致。
+默认目录结构为 10421 个目录、104200 个文件。
+
+    python bench/strm_scan.py --concurrency 1,4,16 --fanout 20,20,25 --files 10 --latency 0.01
+"""
+import argparse
+import os
+import sys
+import time
+
+from mock_dav import propfind_count, running_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import strm4  # noqa: E402
+
+def expected_counts(fanout, files):
+    """mock_dav 目录树的目录数（含根目录）和文件数（根目录下没有文件）"""
+    dirs = level = 1
+    for n in fanout:
+        level *= n
+        dirs += level
+    return dirs, files * (dirs - 1)
+
+def main():
+    parser = argparse.ArgumentParser(description="strm4.py 遍历基准测试")
+    parser.add_argument("--concurrency", default="1,4,16", help="要测试的并发数，逗号分隔")
+    parser.add_argument("--fanout", default="20,20,25")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    expected_dirs, expected_files = expected_counts([int(x) for x in args.fanout.split(",")], args.files)
+    with running_server(args.port, args.fanout, args.files, args.latency) as address:
+        root_url = address + "/dav/lib/"
+        print("目录结构：%s，每个目录 %d 个文件，共 %d 个目录、%d 个文件，延迟 %.3f 秒" % (
+            args.fanout, args.files, expected_dirs, expected_files, args.latency))
+        for concurrency in [int(x) for x in args.concurrency.split(",")]:
+            session = strm4.make_session("u", "p", concurrency)
+            before = propfind_count(address)
+            start = time.time()
+            files = sum(1 for _ in strm4.iter_files(session, root_url, concurrency=concurrency, log=lambda msg: None))
+            seconds = time.time() - start
+            session.close()
+            propfinds = propfind_count(address) - before
+            print("concurrency=%-3d 用时 %6.2f 秒  PROPFIND %d 次  文件 %d 个" % (concurrency, seconds, propfinds, files))
+            assert propfinds == expected_dirs, "PROPFIND 次数 %d，应为 %d" % (propfinds, expected_dirs)
+            assert files == expected_files, "文件数 %d，应为 %d" % (files, expected_files)
+
+if __name__ == "__main__":
+    main()
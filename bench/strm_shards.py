@@ -0,0 +1,65 @@
+"""strm4.py 分片进程数的基准测试
+
+启动 bench/mock_dav.py，对同一个 scan_path 依次用不同的 --shards 完整生成一遍 STRM（每次使用新的输出目录和清单），
+输出用时、相对 --shards 1 的加速比，并检查每次生成的文件完全相同。
+
+    python bench/strm_shards.py --shards 1,2,4,8 --fanout 32,5,4 --latency 0.02
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_dav import propfind_count, running_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STRM4 = os.path.join(HERE, "..", "strm4.py")
+
+def tree_digest(root):
+    """输出目录中所有文件路径和内容的摘要及文件数"""
+    digest = hashlib.sha1()
+    count = 0
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, root).encode("utf-8"))
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            count += 1
+    return digest.hexdigest(), count
+
+def main():
+    parser = argparse.ArgumentParser(description="strm4.py 分片基准测试")
+    parser.add_argument("--shards", default="1,2,4", help="要测试的分片进程数，逗号分隔")
+    parser.add_argument("--fanout", default="32,5,4")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    with running_server(args.port, args.fanout, args.files, args.latency) as address:
+        print("CPU 核数：%s，目录结构：%s，每个目录 %d 个文件，延迟 %.3f 秒" % (os.cpu_count(), args.fanout, args.files, args.latency))
+        baseline = None
+        reference = None
+        for shards in [int(x) for x in args.shards.split(",")]:
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, STRM_MANIFEST_DIR=os.path.join(tmp, "manifest"), STRM_FULL_SCAN="1")
+                before = propfind_count(address)
+                start = time.time()
+                subprocess.run([sys.executable, STRM4, "--config", "", "--docker-address", address, "--scan-path", "/lib",
+                                "--media-root", os.path.join(tmp, "strm"), "--shards", str(shards)],
+                               env=env, stdout=subprocess.DEVNULL, check=True)
+                seconds = time.time() - start
+                propfinds = propfind_count(address) - before
+                digest, count = tree_digest(os.path.join(tmp, "strm"))
+            baseline = baseline or seconds
+            reference = reference or digest
+            print("shards=%-3d 用时 %6.2f 秒  加速比 %5.2f  PROPFIND %d 次  文件 %d 个  %s" % (
+                shards, seconds, baseline / seconds, propfinds, count, "一致" if digest == reference else "不一致！"))
+
+if __name__ == "__main__":
+    main()
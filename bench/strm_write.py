@@ -0,0 +1,68 @@
+"""strm4.py 本地 STRM 写入的基准测试
+
+对 --files 个合成的远端文件路径（每个目录 10 个文件，每 100 个文件一个上级目录）调用 strm4.add_missing，
+先在空目录中全部新建一遍，再原样重跑一遍（全部已存在），输出吞吐量和 os.stat/os.mkdir/os.scandir/os.open 的调用次数。
+--latency 给这些元数据调用各加上固定延迟，模拟 NFS/SMB 等网络挂载。
+
+    python bench/strm_write.py --files 20000 --latency 0.0005
+"""
+import argparse
+import collections
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import strm4  # noqa: E402
+
+COUNTED = ("stat", "mkdir", "scandir", "open")
+
+@contextlib.contextmanager
+def counted_os_calls(latency):
+    """统计（并按需延迟）os 元数据调用，退出时恢复"""
+    counts = collections.Counter()
+    lock = threading.Lock()
+    originals = {name: getattr(os, name) for name in COUNTED}
+
+    def wrap(name, fn):
+        def wrapper(*args, **kwargs):
+            with lock:
+                counts[name] += 1
+            if latency:
+                time.sleep(latency)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    for name, fn in originals.items():
+        setattr(os, name, wrap(name, fn))
+    try:
+        yield counts
+    finally:
+        for name, fn in originals.items():
+            setattr(os, name, fn)
+
+def main():
+    parser = argparse.ArgumentParser(description="strm4.py 写入基准测试")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次元数据调用额外的延迟（秒）")
+    args = parser.parse_args()
+
+    files = ["d%d/s%d/m %d.mkv" % (i // 100, i // 10 % 10, i) for i in range(args.files)]
+    os.umask(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = strm4.ScanConfig("http://127.0.0.1:8765", "u", "p", "/lib", media_root=tmp)
+        print("文件数：%d，元数据调用延迟 %.4f 秒，写入线程 %d" % (args.files, args.latency, strm4.WRITE_WORKERS))
+        for label in ("新建", "重跑"):
+            with counted_os_calls(args.latency) as counts, contextlib.redirect_stdout(io.StringIO()):
+                start = time.time()
+                added = strm4.add_missing(cfg, iter(files))
+                seconds = time.time() - start
+            print("%s：用时 %6.2f 秒  %8.0f 文件/秒  新增 %d  %s" % (
+                label, seconds, len(files) / seconds, added, "  ".join("%s %d" % (name, counts[name]) for name in COUNTED)))
+
+if __name__ == "__main__":
+    main()
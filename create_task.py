@@ -1,10 +1,15 @@
-import requests
-import time
+import httpx
 import argparse
+import asyncio
 import os
 import logging
-import sqlite3
-from typing import List, Tuple, Optional
+import weakref
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Tuple, Optional
+from api_client import AsyncApiClient, get_async_client
+import folder_index
+import storage
+import transfer_ledger
 
 # 配置日志
 def setup_logging():
@@ -32,100 +37,185 @@ def setup_logging():
 setup_logging()
 logger = logging.getLogger(__name__)
 
-# 数据库路径（与 yabot.py 保持一致）
-DB_PATH = os.getenv("DB_PATH", "/app/data/messages.db")
+@dataclass
+class TransferResult:
+    """转存结果"""
+    success: bool
+    transferred_files: int = 0
+    target_folder_id: str = ""
+    target_folder_name: str = ""
+    task_ids: List[str] = field(default_factory=list)
+    error: str = ""
+    # 台账显示已转存过，本次未重复转存
+    skipped: bool = False
+
+# 转存阶段回调，阶段依次为 parse、create、execute
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+async def report_progress(progress: Optional[ProgressCallback], stage: str):
+    if progress is not None:
+        await progress(stage)
+
+# 任务状态轮询：首次间隔、最大间隔（秒）及单个任务的最长等待时间
+TASK_POLL_INITIAL_INTERVAL = float(os.getenv("TASK_POLL_INITIAL_INTERVAL", "1"))
+TASK_POLL_MAX_INTERVAL = float(os.getenv("TASK_POLL_MAX_INTERVAL", "10"))
+TASK_POLL_TIMEOUT = float(os.getenv("TASK_POLL_TIMEOUT", "100"))
+
+def is_task_finished(task: dict) -> bool:
+    """任务是否已有结果：出错、已转存文件或状态为 completed/failed"""
+    if task.get("lastError"):
+        return True
+    if (task.get("currentEpisodes") or 0) > 0:
+        return True
+    return task.get("status") in ("completed", "failed")
+
+class TaskStatusPoller:
+    """共享的任务状态轮询器
+
+    所有等待中的任务共用一个轮询循环，每个周期只请求一次 /api/tasks；
+    间隔从 initial_interval 开始按指数退避增长到 max_interval；有新任务加入时重置间隔，
+    并唤醒正在等待的轮询循环，使下一次请求不晚于 initial_interval 之后。
+    任务出结果或超时后立即通知对应的等待者；请求或解析失败时继续退避重试，
+    轮询循环意外退出时所有等待者收到异常，不会一直挂起。
+    """
+
+    def __init__(self, client: AsyncApiClient, initial_interval: float = TASK_POLL_INITIAL_INTERVAL,
+                 max_interval: float = TASK_POLL_MAX_INTERVAL, backoff: float = 2.0):
+        self.client = client
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._interval = initial_interval
+        self._waiters: Dict[str, List[Tuple[asyncio.Future, float]]] = {}
+        self._last_seen: Dict[str, dict] = {}
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def wait(self, task_id: str, timeout: float = TASK_POLL_TIMEOUT) -> Tuple[Optional[dict], bool]:
+        """等待任务出结果，返回 (最后一次看到的任务数据, 是否在超时前完成)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.setdefault(task_id, []).append((future, loop.time() + timeout))
+        self._interval = self.initial_interval
+        if self._runner is None or self._runner.done():
+            # 每个轮询循环使用新的 Event，确保绑定到当前事件循环
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        try:
+            await self._poll()
+        finally:
+            self._fail_waiters(RuntimeError("任务状态轮询已停止"))
+
+    def _fail_waiters(self, error: Exception):
+        for waiters in self._waiters.values():
+            for future, _ in waiters:
+                if not future.done():
+                    future.set_exception(error)
+        self._waiters.clear()
+        self._last_seen.clear()
+
+    async def _sleep(self):
+        """等待当前间隔；期间有新任务加入时把下一次轮询提前到 initial_interval 之后"""
+        loop = asyncio.get_running_loop()
+        poll_at = loop.time() + self._interval
+        while True:
+            remaining = poll_at - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+            self._wakeup.clear()
+            poll_at = min(poll_at, loop.time() + self.initial_interval)
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            await self._sleep()
+            self._interval = min(self._interval * self.backoff, self.max_interval)
+            try:
+                tasks = await self.client.list_tasks()
+                tasks_by_id = {str(task.get("id")): task for task in tasks.get("data", [])}
+            except Exception as e:
+                # 网络错误、响应不是 JSON 或格式不对：本轮视为没有新状态，按退避间隔重试
+                logger.error("获取任务状态失败: %s", e)
+                tasks_by_id = {}
+
+            now = loop.time()
+            for task_id in list(self._waiters):
+                task = tasks_by_id.get(task_id)
+                if task is not None:
+                    self._last_seen[task_id] = task
+                    logger.info("任务 %s 状态: %s, 已转存文件数: %d", task_id, task.get("status"), task.get("currentEpisodes") or 0)
+                finished = task is not None and is_task_finished(task)
+                pending = []
+                for future, deadline in self._waiters[task_id]:
+                    if future.done():
+                        continue
+                    if finished:
+                        future.set_result((task, True))
+                    elif now >= deadline:
+                        future.set_result((self._last_seen.get(task_id), False))
+                    else:
+                        pending.append((future, deadline))
+                if pending:
+                    self._waiters[task_id] = pending
+                else:
+                    del self._waiters[task_id]
+                    self._last_seen.pop(task_id, None)
+
+_status_poller = None
+
+def get_status_poller(client: AsyncApiClient) -> TaskStatusPoller:
+    """获取进程内共享的任务状态轮询器"""
+    global _status_poller
+    if _status_poller is None or _status_poller.client is not client:
+        _status_poller = TaskStatusPoller(client)
+    return _status_poller
 
 def init_db():
-    """初始化数据库，创建 root_folders 表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS root_folders (
-            name TEXT NOT NULL,
-            folder_id TEXT NOT NULL,
-            parent_id TEXT NOT NULL,
-            PRIMARY KEY (folder_id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def get_folder_tree(session: requests.Session, server_url: str, account_id: str, folder_id: str = "-11") -> List[dict]:
-    """获取账号的目录树"""
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-    url = f"{server_url}/api/folders/{account_id}?folderId={folder_id}"
-    try:
-        response = session.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        if not data.get("success"):
-            logger.error("获取目录失败: %s", data.get("error", "未知错误"))
-            return []
-        return data.get("data", [])
-    except requests.exceptions.RequestException as e:
-        logger.error("获取目录失败: %s", e)
-        return []
+    """初始化数据库，执行 storage 中的表结构迁移"""
+    storage.migrate()
 
-def flatten_folder_tree(session: requests.Session, server_url: str, account_id: str, folders: List[dict], prefix: str = "") -> List[Tuple[str, str]]:
-    """将目录树展平为 (名称路径, ID) 的列表"""
-    result = []
-    for folder in folders:
-        path = f"{prefix}/{folder['name']}" if prefix else folder['name']
-        result.append((path, folder['id']))
-        sub_folders = get_folder_tree(session, server_url, account_id, folder['id'])
-        result.extend(flatten_folder_tree(session, server_url, account_id, sub_folders, path))
-    return result
+# 同一转存键同时只处理一次，重复发送的链接等待前一次结束后直接命中台账
+_ledger_locks: "weakref.WeakValueDictionary[Tuple[str, str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _ledger_lock(share_link: str, access_code: str, target_folder_id: str) -> asyncio.Lock:
+    key = (share_link, access_code or "", target_folder_id)
+    lock = _ledger_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _ledger_locks[key] = lock
+    return lock
 
-def save_root_folders(session: requests.Session, server_url: str, account_id: str):
+async def save_root_folders(client: AsyncApiClient, account_id: str):
     """保存根目录信息到数据库"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM root_folders WHERE parent_id = '-11'")
-    if cursor.fetchone()[0] > 0:
-        conn.close()
+    if await storage.run(folder_index.is_root_listed):
         return
-    
+
     logger.info("查询根目录 API 响应 (folderId=-11)")
-    folders = get_folder_tree(session, server_url, account_id, folder_id="-11")
-    for folder in folders:
-        name = folder['name']
-        folder_id = folder['id']
-        parent_id = folder['pId']
-        cursor.execute(
-            "INSERT OR REPLACE INTO root_folders (name, folder_id, parent_id) VALUES (?, ?, ?)",
-            (name, folder_id, parent_id)
-        )
-        logger.info(f"保存根目录: {name} (ID: {folder_id})")
-    conn.commit()
-    conn.close()
+    folders = await folder_index.refresh_folder(client, account_id, "-11", "")
+    for folder in folders or []:
+        logger.info(f"保存根目录: {folder['name']} (ID: {folder['id']})")
 
 def get_my_transfers_folder_id():
     """从数据库获取 '我的转存' 的 folder_id"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
+    result = storage.query_one(
         "SELECT folder_id FROM root_folders WHERE name = '我的转存' AND parent_id = '-11'"
     )
-    result = cursor.fetchone()
-    conn.close()
     return result[0] if result else None
 
 def get_folder_from_history(target_folder_id: str) -> Optional[str]:
     """从历史记录中获取目标目录路径"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
+    result = storage.query_one(
         "SELECT target_folder_name FROM messages WHERE target_folder_id = ? LIMIT 1",
         (target_folder_id,)
     )
-    result = cursor.fetchone()
-    conn.close()
     if result:
         folder_path = result[0]
         logger.info(f"直接从历史记录获取目标目录: {folder_path} (ID: {target_folder_id})")
@@ -136,323 +226,293 @@ def update_history_folder(folder_path: str, folder_id: str):
     """更新历史记录（messages 表已通过 save_to_db 更新，这里无需额外操作）"""
     pass  # yabot.py 的 save_to_db 已记录历史，无需重复
 
-def get_folder_name_by_id(session: requests.Session, server_url: str, account_id: str, folder_id: str, max_depth: int = 10) -> str:
+async def get_folder_name_by_id(client: AsyncApiClient, account_id: str, folder_id: str, max_depth: int = 10) -> str:
     """通过目录 ID 获取目录名称及其完整路径，优化查找逻辑"""
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-
-    # 步骤 1：优先从历史记录中查找
-    folder_path = get_folder_from_history(folder_id)
+    # 步骤 1：沿本地目录索引的父目录指针解析，无需请求
+    folder_path = await folder_index.resolve_folder_path(folder_id)
     if folder_path:
+        logger.info("从本地目录索引解析目标目录: %s (ID: %s)", folder_path, folder_id)
         return folder_path
 
-    # 步骤 2：从 '我的转存' 开始查找
-    my_transfers_id = get_my_transfers_folder_id()
+    # 步骤 2：从历史记录中查找
+    folder_path = await storage.run(get_folder_from_history, folder_id)
+    if folder_path:
+        return folder_path
+
+    # 步骤 3：目录尚未进入索引，从 '我的转存' 开始遍历查找（遍历结果同时写入索引）
+    my_transfers_id = await storage.run(get_my_transfers_folder_id)
     if not my_transfers_id:
         logger.info("未找到 '我的转存' 目录，保存根目录信息")
-        save_root_folders(session, server_url, account_id)
-        my_transfers_id = get_my_transfers_folder_id()
+        await save_root_folders(client, account_id)
+        my_transfers_id = await storage.run(get_my_transfers_folder_id)
         if not my_transfers_id:
             logger.warning("仍未找到 '我的转存' 目录，fallback 到根目录查找")
 
-    def find_folder_recursive(current_folder_id: str, target_folder_id: str, current_path: List[str], visited: set, depth: int = 0) -> Optional[List[str]]:
-        if depth >= max_depth:
-            logger.error("达到最大递归深度 (%d)，仍未找到目录 ID: %s", max_depth, target_folder_id)
-            return None
-
-        if current_folder_id in visited:
-            logger.error("检测到循环，目录 ID: %s 已访问", current_folder_id)
-            return None
-
-        visited.add(current_folder_id)
-        url = f"{server_url}/api/folders/{account_id}?folderId={current_folder_id}"
-        try:
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            logger.info("查询目录 API 响应 (folderId=%s): %s", current_folder_id, data)
-            if not data.get("success"):
-                logger.error("查询目录失败: %s", data.get("error", "未知错误"))
-                return None
-
-            folder_data = data.get("data", {})
-            if not folder_data:
-                logger.warning("目录数据为空 (folderId=%s)", current_folder_id)
-                return None
-
-            if isinstance(folder_data, list):
-                for folder in folder_data:
-                    fid = str(folder.get("id"))
-                    fname = folder.get("name") or folder.get("folderName") or "未分类"
-                    if fid == target_folder_id:
-                        return current_path + [fname]
-                    sub_path = find_folder_recursive(fid, target_folder_id, current_path + [fname], visited, depth + 1)
-                    if sub_path:
-                        return sub_path
-            elif isinstance(folder_data, dict):
-                fid = str(folder_data.get("id"))
-                fname = folder_data.get("name") or folder_data.get("folderName") or "未分类"
-                if fid == target_folder_id:
-                    return current_path + [fname]
-            else:
-                logger.warning("folder_data 格式不正确: %s", folder_data)
-                return None
-        except requests.exceptions.RequestException as e:
-            logger.error("查询目录失败: %s", e)
-            return None
-        return None
-
-    # 从 '我的转存' 开始查找
+    # 从 '我的转存' 开始逐层并发查找
     path = None
     if my_transfers_id:
         logger.info("从 '我的转存' (ID: %s) 开始查找目标目录 ID: %s", my_transfers_id, folder_id)
-        path = find_folder_recursive(my_transfers_id, folder_id, ["我的转存"], set())
+        path = await folder_index.find_folder_path(client, account_id, [(my_transfers_id, "我的转存")], folder_id, max_depth)
     
     # 如果未找到，fallback 到根目录查找
     if not path:
         logger.info("在 '我的转存' 中未找到目标目录，fallback 到根目录查找目标目录 ID: %s", folder_id)
-        path = find_folder_recursive("-11", folder_id, [], set())
+        path = await folder_index.find_folder_path(client, account_id, [("-11", "")], folder_id, max_depth)
     
     if not path:
         logger.error("未找到目标目录 ID: %s", folder_id)
         return "未分类"
     
-    full_path = "/".join(path)
-    logger.info("找到目标目录路径: %s (ID: %s)", full_path, folder_id)
+    logger.info("找到目标目录路径: %s (ID: %s)", path, folder_id)
     # 更新历史记录（由 yabot.py 的 save_to_db 负责）
-    return full_path
+    return path
 
-def match_folder_by_name(session: requests.Session, server_url: str, account_id: str, folder_name: str) -> Tuple[str, str]:
+# 同一时间只进行一次目录索引同步，批量转存的各个工作协程不会各自遍历整个网盘
+_index_sync_lock = asyncio.Lock()
+
+async def match_folder_by_name(client: AsyncApiClient, account_id: str, folder_name: str) -> Tuple[str, str]:
     """根据文件夹名称模糊匹配目标文件夹"""
     logger.info("根据名称 '%s' 匹配文件夹...", folder_name)
-    folders = get_folder_tree(session, server_url, account_id)
-    if not folders:
-        logger.error("无法获取目录树")
-        return None, None
-
-    flat_folders = flatten_folder_tree(session, server_url, account_id, folders)
-    matches = [(path, fid) for path, fid in flat_folders if folder_name.lower() in path.lower()]
+    if not await storage.run(folder_index.is_index_complete):
+        async with _index_sync_lock:
+            # 等锁期间其他协程可能已经建好索引
+            if not await storage.run(folder_index.is_index_complete):
+                logger.info("本地目录索引未建立完整，开始构建...")
+                await folder_index.sync_folder_index(client, account_id)
+        if not await storage.run(folder_index.is_root_listed):
+            logger.error("无法获取目录树")
+            return None, None
+
+    matches = await folder_index.search_folders(folder_name)
+    if not matches:
+        # 本地索引未命中时，仅刷新过期的子树后再查一次（等锁期间索引可能已被其他协程刷新，同样重查）
+        async with _index_sync_lock:
+            await folder_index.sync_folder_index(client, account_id)
+        matches = await folder_index.search_folders(folder_name)
     if not matches:
         logger.error("未找到匹配 '%s' 的文件夹", folder_name)
         return None, None
     if len(matches) > 1:
-        logger.warning("找到多个匹配 '%s' 的文件夹，选择第一个: %s", folder_name, matches[0][0])
+        logger.info("找到多个匹配 '%s' 的文件夹，按相关度选择: %s (候选: %s)", folder_name, matches[0][0], [path for path, _ in matches[1:5]])
     path, fid = matches[0]
     logger.info("匹配文件夹: %s (ID: %s)", path, fid)
     return path, fid
 
-def parse_share_folders(session: requests.Session, server_url: str, account_id: str, share_link: str, access_code: str) -> List[str]:
+async def parse_share_folders(client: AsyncApiClient, account_id: str, share_link: str, access_code: str) -> List[str]:
     """解析分享链接获取文件夹列表"""
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-    url = f"{server_url}/api/share/parse"
-    payload = {"shareLink": share_link, "accountId": account_id, "accessCode": access_code}
     try:
-        response = session.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        result = response.json()
+        result = await client.parse_share(account_id, share_link, access_code)
         if not result.get("success"):
             logger.error("解析分享链接失败: %s", result.get("error", "未知错误"))
             return []
         return result.get("data", [])
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error("解析分享链接失败: %s", e)
         return []
 
-def login_and_create_task(share_link: str, access_code: str = "", target_folder_id: str = "", target_folder_name: str = "") -> tuple[bool, int, str, str]:
-    """登录并创建转存任务，返回 (成功状态, 转存文件总数, 目标目录 ID, 目标目录名称)"""
-    session = requests.Session()
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-
-    server_url = os.getenv("SERVER_URL", "http://your-server:3000").rstrip('/')
-    login_url = f"{server_url}/api/auth/login"
-    accounts_url = f"{server_url}/api/accounts"
-    create_task_url = f"{server_url}/api/tasks"
-    tasks_url = f"{server_url}/api/tasks"
-    username = os.getenv("USERNAME", "your_username")
-    password = os.getenv("PASSWORD", "your_password")
-    default_folder_id = os.getenv("TARGET_FOLDER_ID", "-11")
-
-    logger.info("获取初始 Cookie...")
-    try:
-        response = session.get(server_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        logger.info("初始 Cookie 获取成功: %s", session.cookies.get_dict())
-    except requests.exceptions.RequestException as e:
-        logger.error("初始请求失败: %s", e)
-        return False, 0, "", ""
-
-    logger.info("登录...")
-    login_data = {"username": username, "password": password}
-    try:
-        response = session.post(login_url, json=login_data, headers=headers, timeout=10)
-        response.raise_for_status()
-        logger.info("登录成功: %s", response.json())
-    except requests.exceptions.RequestException as e:
-        logger.error("登录失败: %s", e)
-        return False, 0, "", ""
-
-    logger.info("获取账号列表...")
+async def fetch_tasks(client: AsyncApiClient) -> Optional[List[dict]]:
+    """获取服务端任务列表，失败时返回 None"""
     try:
-        response = session.get(accounts_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        accounts = response.json()
-        account_id = str(accounts.get("data", [{}])[0].get("id")) if accounts.get("data") else None
-        if not account_id:
-            logger.error("未找到有效的账号 ID")
-            return False, 0, "", ""
-        logger.info("使用账号 ID: %s", account_id)
-    except requests.exceptions.RequestException as e:
-        logger.error("获取账号列表失败: %s", e)
-        return False, 0, "", ""
-
-    logger.info("解析分享链接...")
-    share_folders = parse_share_folders(session, server_url, account_id, share_link, access_code)
-    if not share_folders:
-        logger.error("未获取到分享文件夹")
-        return False, 0, "", ""
-    logger.info("分享文件夹: %s", share_folders)
-
-    final_target_folder_id = ""
-    final_target_folder_name = ""
-    if target_folder_id:
-        logger.info("使用指定目标文件夹 ID: %s", target_folder_id)
-        final_target_folder_id = target_folder_id
-        final_target_folder_name = get_folder_name_by_id(session, server_url, account_id, target_folder_id)
-    elif target_folder_name:
-        folder_path, matched_folder_id = match_folder_by_name(session, server_url, account_id, target_folder_name)
-        if matched_folder_id:
-            final_target_folder_id = matched_folder_id
-            final_target_folder_name = folder_path
-            logger.info("使用匹配文件夹: %s (ID: %s)", folder_path, final_target_folder_id)
-        else:
-            logger.warning("未找到匹配 '%s' 的文件夹，使用默认文件夹 ID: %s", target_folder_name, default_folder_id)
-            final_target_folder_id = default_folder_id
-            final_target_folder_name = get_folder_name_by_id(session, server_url, account_id, default_folder_id)
-    else:
-        logger.info("未指定文件夹，使用默认文件夹 ID: %s", default_folder_id)
-        final_target_folder_id = default_folder_id
-        final_target_folder_name = get_folder_name_by_id(session, server_url, account_id, default_folder_id)
-
-    logger.info("创建任务...")
-    task_data = {
-        "accountId": account_id,
-        "shareLink": share_link,
-        "totalEpisodes": "",
-        "accessCode": access_code,
-        "cronExpression": "",
-        "enableCron": False,
-        "matchOperator": "",
-        "matchPattern": "",
-        "matchValue": "",
-        "overwriteFolder": 1,
-        "remark": "",
-        "targetFolderId": final_target_folder_id,
-        "targetFolder": final_target_folder_name,
-        "selectedFolders": share_folders
-    }
-    try:
-        response = session.post(create_task_url, json=task_data, headers=headers, timeout=10)
-        response.raise_for_status()
-        result = response.json()
-        if not result.get("success"):
-            logger.error("任务创建失败: %s", result.get("error"))
-            return False, 0, final_target_folder_id, final_target_folder_name
-        task_ids = [str(task.get("id")) for task in result.get("data", [])]
-        if not task_ids:
-            logger.error("未找到任务 ID")
-            return False, 0, final_target_folder_id, final_target_folder_name
-        logger.info("任务创建成功，任务 ID: %s", task_ids)
-    except requests.exceptions.RequestException as e:
-        logger.error("任务创建失败: %s", e)
-        return False, 0, final_target_folder_id, final_target_folder_name
+        return (await client.list_tasks()).get("data", [])
+    except httpx.HTTPError as e:
+        logger.error("获取任务列表失败: %s", e)
+        return None
 
+def find_tasks_for_share(tasks: List[dict], share_link: str, target_folder_id: str) -> List[str]:
+    """在任务列表中查找同一分享链接、同一目标目录的任务 ID"""
+    return [
+        str(task.get("id")) for task in tasks
+        if task.get("shareLink") == share_link and str(task.get("targetFolderId")) == str(target_folder_id)
+    ]
+
+async def resume_from_ledger(client: AsyncApiClient, entry: transfer_ledger.LedgerEntry) -> Optional[List[str]]:
+    """根据台账恢复任务 ID：确认任务仍存在于服务端；创建结果未知时按分享链接和目标目录找回任务
+
+    返回可复用的任务 ID；返回空列表表示需要重新创建；返回 None 表示无法确认（如任务列表请求失败）。
+    """
+    tasks = await fetch_tasks(client)
+    if tasks is None:
+        return None
+    if entry.task_ids:
+        existing = {str(task.get("id")) for task in tasks}
+        if all(task_id in existing for task_id in entry.task_ids):
+            return entry.task_ids
+        logger.info("台账中的任务 %s 已不存在，重新创建", entry.task_ids)
+        return []
+    task_ids = find_tasks_for_share(tasks, entry.share_link, entry.target_folder_id)
+    if task_ids:
+        logger.info("找回上次创建请求已生成的任务: %s", task_ids)
+    return task_ids
+
+async def run_tasks(client: AsyncApiClient, task_ids: List[str]) -> Tuple[bool, int, List[str]]:
+    """执行任务并等待结果，返回 (是否全部成功, 转存文件数, 错误信息)"""
     logger.info("执行任务 %s...", task_ids)
     for task_id in task_ids:
-        execute_task_url = f"{server_url}/api/tasks/{task_id}/execute"
         try:
-            response = session.post(execute_task_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            result = response.json()
+            result = await client.execute_task(task_id)
             if not result.get("success"):
                 logger.error("任务 %s 执行失败: %s", task_id, result.get("error"))
                 continue
             logger.info("任务 %s 执行成功", task_id)
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error("任务 %s 执行失败: %s", task_id, e)
             continue
 
     logger.info("检查任务状态...")
-    max_wait_attempts = 10
-    wait_interval = 10
     all_success = True
+    errors = []
     total_transferred_files = 0
-
-    for task_id in task_ids:
+    poller = get_status_poller(client)
+    results = await asyncio.gather(*(poller.wait(task_id) for task_id in task_ids))
+
+    for task_id, (task, finished) in zip(task_ids, results):
+        task = task or {}
+        task_status = task.get("status")
+        current_episodes = task.get("currentEpisodes", 0) or 0
+        last_error = task.get("lastError")
         task_transferred_files = 0
-        for attempt in range(max_wait_attempts):
-            try:
-                response = session.get(tasks_url, headers=headers, timeout=10)
-                response.raise_for_status()
-                tasks = response.json()
-                task_status = None
-                current_episodes = 0
-                last_error = None
-                for task in tasks.get("data", []):
-                    if str(task.get("id")) == task_id:
-                        task_status = task.get("status")
-                        current_episodes = task.get("currentEpisodes", 0)
-                        last_error = task.get("lastError")
-                        logger.info("任务 %s 状态: %s, 已转存文件数: %d", task_id, task_status, current_episodes)
-                        if last_error:
-                            logger.error("任务 %s 错误: %s", task_id, last_error)
-                            all_success = False
-                            break
-                        if current_episodes > 0 and last_error is None:
-                            logger.info("任务 %s 文件已转存，视为成功，无需继续检查", task_id)
-                            task_transferred_files = current_episodes
-                            break
-                        if task_status in ["completed", "failed"]:
-                            task_transferred_files = current_episodes
-                            break
-                if last_error or task_status == "failed":
-                    all_success = False
-                    break
-                if current_episodes > 0 and last_error is None:
-                    task_transferred_files = current_episodes
-                    break
-                if task_status == "completed":
-                    logger.info("任务 %s 已完成", task_id)
-                    task_transferred_files = current_episodes
-                    break
-                logger.info("任务 %s 仍在处理中，等待 %s 秒后重试... (尝试 %s/%s)", task_id, wait_interval, attempt + 1, max_wait_attempts)
-                time.sleep(wait_interval)
-            except requests.exceptions.RequestException as e:
-                logger.error("获取任务 %s 状态失败: %s", task_id, e)
-                all_success = False
-                break
-        else:
+        if last_error:
+            logger.error("任务 %s 错误: %s", task_id, last_error)
+            all_success = False
+            errors.append(f"任务 {task_id}: {last_error}")
+        elif task_status == "failed":
+            logger.error("任务 %s 执行失败", task_id)
+            all_success = False
+            errors.append(f"任务 {task_id} 执行失败")
+            task_transferred_files = current_episodes
+        elif not finished:
             logger.warning("任务 %s 未能在预期时间内完成，但可能已转存", task_id)
             task_transferred_files = current_episodes
+        else:
+            task_transferred_files = current_episodes
 
         total_transferred_files += task_transferred_files
         logger.info("任务 %s 最终转存文件数: %d", task_id, task_transferred_files)
 
     logger.info("所有任务总计转存文件数: %d", total_transferred_files)
-    return all_success, total_transferred_files, final_target_folder_id, final_target_folder_name
+    return all_success, total_transferred_files, errors
+
+async def resolve_target_folder(client: AsyncApiClient, account_id: str, target_folder_id: str, target_folder_name: str) -> Tuple[str, str]:
+    """确定最终目标目录，返回 (目录 ID, 目录路径)"""
+    default_folder_id = os.getenv("TARGET_FOLDER_ID", "-11")
+    if target_folder_id:
+        logger.info("使用指定目标文件夹 ID: %s", target_folder_id)
+        return target_folder_id, await get_folder_name_by_id(client, account_id, target_folder_id)
+    if target_folder_name:
+        folder_path, matched_folder_id = await match_folder_by_name(client, account_id, target_folder_name)
+        if matched_folder_id:
+            logger.info("使用匹配文件夹: %s (ID: %s)", folder_path, matched_folder_id)
+            return matched_folder_id, folder_path
+        logger.warning("未找到匹配 '%s' 的文件夹，使用默认文件夹 ID: %s", target_folder_name, default_folder_id)
+    else:
+        logger.info("未指定文件夹，使用默认文件夹 ID: %s", default_folder_id)
+    return default_folder_id, await get_folder_name_by_id(client, account_id, default_folder_id)
+
+async def login_and_create_task(share_link: str, access_code: str = "", target_folder_id: str = "", target_folder_name: str = "",
+                                progress: Optional[ProgressCallback] = None, force: bool = False) -> TransferResult:
+    """登录并创建转存任务，返回转存结果
+
+    以 (分享链接, 访问码, 目标目录) 为键查询转存台账：已成功转存且任务仍存在时直接返回（force 时重新执行已有任务）；
+    已创建过任务时复用任务 ID，不会重复创建。
+    """
+    client = get_async_client()
+
+    try:
+        account_id = await client.get_account_id()
+    except httpx.HTTPError as e:
+        logger.error("登录或获取账号列表失败: %s", e)
+        return TransferResult(False, error=f"登录失败: {e}")
+    if not account_id:
+        logger.error("未找到有效的账号 ID")
+        return TransferResult(False, error="未找到有效的账号 ID")
+
+    final_target_folder_id, final_target_folder_name = await resolve_target_folder(client, account_id, target_folder_id, target_folder_name)
+
+    async with _ledger_lock(share_link, access_code, final_target_folder_id):
+        task_ids = []
+        entry = await storage.run(transfer_ledger.lookup, share_link, access_code, final_target_folder_id)
+        if entry is not None:
+            task_ids = await resume_from_ledger(client, entry)
+            if task_ids is None:
+                return TransferResult(False, 0, final_target_folder_id, final_target_folder_name, error="无法确认已有任务状态")
+            if not task_ids:
+                await storage.run(transfer_ledger.forget, entry.id)
+            elif entry.status == transfer_ledger.STATUS_DONE and not force:
+                logger.info("分享链接已转存到 %s，跳过（任务 ID: %s）", final_target_folder_name, task_ids)
+                return TransferResult(True, entry.transferred_files, final_target_folder_id, final_target_folder_name, task_ids, skipped=True)
+            else:
+                logger.info("复用台账中的任务 %s（状态: %s）", task_ids, entry.status)
+                if entry.status == transfer_ledger.STATUS_CREATING:
+                    await storage.run(transfer_ledger.record_tasks, entry.id, task_ids)
+                ledger_id = entry.id
+
+        if not task_ids:
+            await report_progress(progress, "parse")
+            logger.info("解析分享链接...")
+            share_folders = await parse_share_folders(client, account_id, share_link, access_code)
+            if not share_folders:
+                logger.error("未获取到分享文件夹")
+                return TransferResult(False, 0, final_target_folder_id, final_target_folder_name, error="未获取到分享文件夹")
+            logger.info("分享文件夹: %s", share_folders)
+
+            await report_progress(progress, "create")
+            logger.info("创建任务...")
+            task_data = {
+                "accountId": account_id,
+                "shareLink": share_link,
+                "totalEpisodes": "",
+                "accessCode": access_code,
+                "cronExpression": "",
+                "enableCron": False,
+                "matchOperator": "",
+                "matchPattern": "",
+                "matchValue": "",
+                "overwriteFolder": 1,
+                "remark": "",
+                "targetFolderId": final_target_folder_id,
+                "targetFolder": final_target_folder_name,
+                "selectedFolders": share_folders
+            }
+            # 先登记再提交，创建请求超时后重试时可按分享链接找回已创建的任务
+            ledger_id = await storage.run(transfer_ledger.begin, share_link, access_code, final_target_folder_id)
+            try:
+                result = await client.create_task(task_data)
+                if not result.get("success"):
+                    logger.error("任务创建失败: %s", result.get("error"))
+                    await storage.run(transfer_ledger.forget, ledger_id)
+                    return TransferResult(False, 0, final_target_folder_id, final_target_folder_name, error=f"任务创建失败: {result.get('error')}")
+                task_ids = [str(task.get("id")) for task in result.get("data", [])]
+                if not task_ids:
+                    logger.error("未找到任务 ID")
+                    return TransferResult(False, 0, final_target_folder_id, final_target_folder_name, error="未找到任务 ID")
+                logger.info("任务创建成功，任务 ID: %s", task_ids)
+                await storage.run(transfer_ledger.record_tasks, ledger_id, task_ids)
+            except httpx.HTTPError as e:
+                logger.error("任务创建失败: %s", e)
+                return TransferResult(False, 0, final_target_folder_id, final_target_folder_name, error=f"任务创建失败: {e}")
+
+        await report_progress(progress, "execute")
+        all_success, total_transferred_files, errors = await run_tasks(client, task_ids)
+        await storage.run(transfer_ledger.finish, ledger_id, all_success, total_transferred_files, "; ".join(errors))
+
+    # 转存会在目标目录下新建文件夹，使其目录列表缓存失效
+    storage.write_behind(folder_index.mark_folder_stale, final_target_folder_id)
+    return TransferResult(all_success, total_transferred_files, final_target_folder_id, final_target_folder_name, task_ids, "; ".join(errors))
+
+async def create_transfer(share_link: str, access_code: str = "", target_folder_id: str = "", target_folder_name: str = "",
+                          max_retries: int = 3, retry_delay: int = 5, progress: Optional[ProgressCallback] = None,
+                          force: bool = False) -> TransferResult:
+    """转存引擎入口：创建转存任务，失败时自动重试；重试通过转存台账复用已创建的任务"""
+    result = TransferResult(False)
+    for attempt in range(max_retries):
+        logger.info("尝试第 %s 次...", attempt + 1)
+        result = await login_and_create_task(share_link, access_code, target_folder_id, target_folder_name, progress, force)
+        if result.success:
+            break
+        if attempt < max_retries - 1:
+            logger.info("等待 %s 秒后重试...", retry_delay)
+            await asyncio.sleep(retry_delay)
+    return result
 
 def main():
     init_db()  # 初始化数据库
@@ -461,6 +521,7 @@ def main():
     parser.add_argument("--access-code", default="", help="分享链接的访问密码（可选）")
     parser.add_argument("--target-folder-id", help="目标文件夹 ID（可选）")
     parser.add_argument("--target-folder-name", default="", help="目标文件夹名称（可选，模糊匹配）")
+    parser.add_argument("--force", action="store_true", help="已转存过的链接也重新执行已有任务（可选）")
     args = parser.parse_args()
 
     share_link = args.share_link
@@ -479,24 +540,15 @@ def main():
     elif target_folder_name:
         logger.info("指定目标文件夹名称: %s", target_folder_name)
 
-    max_retries = 3
-    retry_delay = 5
-    for attempt in range(max_retries):
-        logger.info("尝试第 %s 次...", attempt + 1)
-        success, transferred_files, final_target_folder_id, final_target_folder_name = login_and_create_task(
-            share_link, access_code, target_folder_id, target_folder_name
-        )
-        if success:
-            logger.info("脚本执行成功！总计转存文件数: %d", transferred_files)
-            logger.info("最终目标目录: %s (ID: %s)", final_target_folder_name, final_target_folder_id)
-            break
-        else:
-            if attempt < max_retries - 1:
-                logger.info("等待 %s 秒后重试...", retry_delay)
-                time.sleep(retry_delay)
-            else:
-                logger.error("达到最大重试次数，脚本执行失败！总计转存文件数: %d", transferred_files)
-                exit(1)
+    result = asyncio.run(create_transfer(share_link, access_code, target_folder_id, target_folder_name, force=args.force))
+    if result.skipped:
+        logger.info("该链接已转存过，未重复转存（任务 ID: %s）", result.task_ids)
+    elif result.success:
+        logger.info("脚本执行成功！总计转存文件数: %d", result.transferred_files)
+        logger.info("最终目标目录: %s (ID: %s)", result.target_folder_name, result.target_folder_id)
+    else:
+        logger.error("达到最大重试次数，脚本执行失败！总计转存文件数: %d", result.transferred_files)
+        exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
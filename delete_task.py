@@ -1,8 +1,12 @@
 # delete_task.py（完整代码）
-import requests
+import httpx
+import asyncio
 import os
+import time
 import logging
-from typing import List, Dict, Tuple
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
+from api_client import AsyncApiClient, get_async_client
 
 # 配置日志
 logging.basicConfig(
@@ -12,97 +16,128 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def login_and_get_tasks(task_name: str = "") -> Tuple[requests.Session, List[Dict], bool]:
-    """登录并获取任务列表，支持按任务名称过滤，返回 (会话, 任务列表, 是否成功)"""
-    session = requests.Session()
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-
-    # 从环境变量读取配置
-    server_url = os.getenv("SERVER_URL", "http://your-server:3000").rstrip('/')
-    login_url = f"{server_url}/api/auth/login"
-    tasks_url = f"{server_url}/api/tasks"
-    username = os.getenv("USERNAME", "your_username")
-    password = os.getenv("PASSWORD", "your_password")
-
-    # 步骤 1：获取初始 Cookie
-    logger.info("获取初始 Cookie...")
-    try:
-        response = session.get(server_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        logger.info("初始 Cookie 获取成功: %s", session.cookies.get_dict())
-    except requests.exceptions.RequestException as e:
-        logger.error("初始请求失败: %s", e)
-        return session, [], False
-
-    # 步骤 2：登录
-    logger.info("登录...")
-    login_data = {"username": username, "password": password}
-    try:
-        response = session.post(login_url, json=login_data, headers=headers, timeout=10)
-        response.raise_for_status()
-        logger.info("登录成功: %s", response.json())
-    except requests.exceptions.RequestException as e:
-        logger.error("登录失败: %s", e)
-        return session, [], False
-
-    # 步骤 3：获取任务列表
+# 批量删除时同时进行的删除请求数
+DELETE_CONCURRENCY = int(os.getenv("DELETE_CONCURRENCY", "5"))
+
+# 删除进度回调，参数为 (已完成数, 失败数)
+DeleteProgressCallback = Callable[[int, int], Awaitable[None]]
+
+# 任务列表缓存有效期（秒），同一筛选条件在有效期内共享一次查询结果
+TASK_LIST_CACHE_TTL = float(os.getenv("TASK_LIST_CACHE_TTL", "30"))
+
+@dataclass
+class TaskListing:
+    """按筛选条件查询到的任务列表，只保留 ID 和显示名称，分页内容在展示时才切片生成"""
+    task_ids: List[str]
+    names: Dict[str, str]
+    fetched_at: float
+
+    def __len__(self) -> int:
+        return len(self.task_ids)
+
+    def page(self, page: int, per_page: int) -> List[Tuple[str, str]]:
+        """返回第 page 页的 (任务 ID, 名称)"""
+        start = page * per_page
+        return [(task_id, self.names[task_id]) for task_id in self.task_ids[start:start + per_page]]
+
+# 筛选条件（小写）-> TaskListing
+_listing_cache: Dict[str, TaskListing] = {}
+_listing_locks: Dict[str, asyncio.Lock] = {}
+
+def task_full_name(task: Dict) -> str:
+    """任务显示名称：资源名/分享目录名"""
+    resource_name = task.get("resourceName", "")
+    share_folder_name = task.get("shareFolderName", "")
+    return f"{resource_name}/{share_folder_name}" if share_folder_name else resource_name
+
+async def fetch_task_listing(client: AsyncApiClient, task_name: str = "") -> Optional[TaskListing]:
+    """从服务端获取任务列表，支持按任务名称过滤，失败时返回 None
+
+    筛选条件通过 search 参数交给服务端过滤，本地再按名称校验一遍（服务端可能匹配其他字段或不支持该参数）。
+    """
     logger.info("获取任务列表...")
     try:
-        response = session.get(tasks_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        tasks = response.json()
+        tasks = await client.list_tasks(params={"search": task_name} if task_name else None)
         if not tasks.get("success"):
             logger.error("获取任务列表失败: %s", tasks.get("error", "未知错误"))
-            return session, [], False
-        task_list = tasks.get("data", [])
-        if not task_list:
-            logger.info("任务列表为空")
-            return session, [], True
-
-        # 按任务名称过滤
-        if task_name:
-            logger.info("根据任务名称 '%s' 过滤任务...", task_name)
-            filtered_tasks = []
-            for task in task_list:
-                resource_name = task.get("resourceName", "")
-                share_folder_name = task.get("shareFolderName", "")
-                full_name = f"{resource_name}/{share_folder_name}" if share_folder_name else resource_name
-                if task_name.lower() in full_name.lower():
-                    filtered_tasks.append(task)
-            task_list = filtered_tasks
-
-        return session, task_list, True
-    except requests.exceptions.RequestException as e:
+            return None
+    except httpx.HTTPError as e:
         logger.error("获取任务列表失败: %s", e)
-        return session, [], False
+        return None
+
+    needle = task_name.lower()
+    task_ids = []
+    names = {}
+    for task in tasks.get("data") or []:
+        full_name = task_full_name(task)
+        if needle and needle not in full_name.lower():
+            continue
+        task_id = str(task.get("id"))
+        task_ids.append(task_id)
+        names[task_id] = full_name
+    logger.info("任务列表共 %d 个任务%s", len(task_ids), f"（筛选: '{task_name}'）" if task_name else "")
+    return TaskListing(task_ids, names, time.time())
+
+async def get_task_listing(task_name: str = "", client: Optional[AsyncApiClient] = None) -> Optional[TaskListing]:
+    """获取任务列表（带缓存），同一筛选条件的并发请求只查询一次"""
+    key = task_name.lower()
+    if key not in _listing_locks:
+        _listing_locks[key] = asyncio.Lock()
+    async with _listing_locks[key]:
+        listing = _listing_cache.get(key)
+        if listing is not None and time.time() - listing.fetched_at < TASK_LIST_CACHE_TTL:
+            return listing
+        listing = await fetch_task_listing(client or get_async_client(), task_name)
+        if listing is not None:
+            _listing_cache[key] = listing
+        return listing
 
-def delete_task_by_id(session: requests.Session, task_id: str, delete_cloud: bool) -> Tuple[bool, str]:
+def invalidate_task_listings():
+    """任务被删除后清空缓存，下次查询重新获取"""
+    _listing_cache.clear()
+
+async def delete_task_by_id(client: AsyncApiClient, task_id: str, delete_cloud: bool) -> Tuple[bool, str]:
     """根据任务 ID 删除任务，返回 (是否成功, 错误信息)"""
-    server_url = os.getenv("SERVER_URL", "http://your-server:3000").rstrip('/')
-    headers = {
-        "Accept": "*/*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-        "Cache-Control": "no-cache"
-    }
-
-    delete_task_url = f"{server_url}/api/tasks/{task_id}"
     logger.info("删除任务 ID: %s...", task_id)
     try:
-        response = session.delete(delete_task_url, json={"deleteCloud": delete_cloud}, headers=headers, timeout=10)
-        response.raise_for_status()
-        result = response.json()
+        result = await client.delete_task(task_id, delete_cloud)
         if not result.get("success"):
             error_msg = result.get("error", "未知错误")
             logger.error("任务 %s 删除失败: %s", task_id, error_msg)
             return False, error_msg
         logger.info("任务 %s 删除成功", task_id)
         return True, ""
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error("任务 %s 删除失败: %s", task_id, e)
-        return False, str(e)# Updated for v1.0.3
+        return False, str(e)# Updated for v1.0.3
+
+async def delete_tasks(client: AsyncApiClient, task_ids: List[str], delete_cloud: bool, concurrency: int = DELETE_CONCURRENCY,
+                       progress: Optional[DeleteProgressCallback] = None) -> Dict[str, str]:
+    """并发删除多个任务，同时在途的请求不超过 concurrency，返回删除失败的 {任务 ID: 错误信息}
+
+    每完成一个任务调用一次 progress(已完成数, 失败数)。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    failures = {}
+    finished = 0
+
+    async def delete_one(task_id: str):
+        async with semaphore:
+            return task_id, await delete_task_by_id(client, task_id, delete_cloud)
+
+    tasks = [asyncio.ensure_future(delete_one(task_id)) for task_id in task_ids]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            task_id, (success, error_msg) = await next_done
+            finished += 1
+            if not success:
+                failures[task_id] = error_msg
+            if progress is not None:
+                await progress(finished, len(failures))
+    finally:
+        for task in tasks:
+            task.cancel()
+        if finished > len(failures):
+            invalidate_task_listings()
+    logger.info("批量删除完成：成功 %d，失败 %d", finished - len(failures), len(failures))
+    return failures
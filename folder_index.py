@@ -0,0 +1,410 @@
+import httpx
+import asyncio
+import os
+import heapq
+import math
+import time
+import logging
+import sqlite3
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List, Set, Tuple, Optional
+from api_client import AsyncApiClient
+import storage
+
+logger = logging.getLogger(__name__)
+
+# 目录列表缓存有效期（秒），超过后该目录的子目录会在下次同步时重新获取
+FOLDER_INDEX_TTL = int(os.getenv("FOLDER_INDEX_TTL", "86400"))
+
+# 遍历目录时同时进行的目录列表请求数上限
+FOLDER_CRAWL_CONCURRENCY = int(os.getenv("FOLDER_CRAWL_CONCURRENCY", "8"))
+
+ROOT_FOLDER_ID = "-11"
+
+# 根目录在本地索引中没有名称，解析路径时显示为此名称
+ROOT_FOLDER_NAME = "根目录"
+
+# 解析目录路径时向上查找的最大层数
+MAX_FOLDER_DEPTH = 64
+
+# 最近使用加权的半衰期（秒）
+USAGE_HALF_LIFE = storage.USAGE_HALF_LIFE
+
+# 常用目录排序方式：count 按使用次数，recent 按最近使用加权（每过一个半衰期权重减半）
+COMMON_FOLDERS_RANKING = os.getenv("COMMON_FOLDERS_RANKING", "count")
+
+class FolderSearchIndex:
+    """内存中的目录路径 n-gram 索引，用于快速模糊查找并按相关度排序
+
+    目录名（路径最后一级）完全等于查询串的目录优先作为候选；没有时，路径的小写形式
+    按 1~3 字符切片建立的倒排表按查询串的 n-gram（n 最大为 3）求交集得到候选，再校验子串。
+    候选按目录名完全匹配 > 路径中某一级完全匹配 > 目录名包含查询串打分，层级越浅越优先，
+    并叠加 folder_usage 中的使用次数和最近使用时间。
+    """
+
+    def __init__(self):
+        self.paths: Dict[str, str] = {}
+        self.lower_paths: Dict[str, str] = {}
+        self.grams: Dict[str, Set[str]] = defaultdict(set)
+        self.names: Dict[str, Set[str]] = defaultdict(set)
+        self.usage: Dict[str, Tuple[int, float]] = {}
+        self.loaded = False
+
+    @staticmethod
+    def _ngrams(text: str, sizes=(1, 2, 3)) -> Set[str]:
+        return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+    def add(self, folder_id: str, path: str):
+        if folder_id in self.paths:
+            self.remove(folder_id)
+        lower_path = path.lower()
+        self.paths[folder_id] = path
+        self.lower_paths[folder_id] = lower_path
+        for gram in self._ngrams(lower_path):
+            self.grams[gram].add(folder_id)
+        self.names[lower_path.rsplit("/", 1)[-1]].add(folder_id)
+
+    def remove(self, folder_id: str):
+        lower_path = self.lower_paths.pop(folder_id, None)
+        self.paths.pop(folder_id, None)
+        if lower_path is None:
+            return
+        for gram in self._ngrams(lower_path):
+            postings = self.grams.get(gram)
+            if postings is not None:
+                postings.discard(folder_id)
+                if not postings:
+                    del self.grams[gram]
+        name = lower_path.rsplit("/", 1)[-1]
+        self.names[name].discard(folder_id)
+        if not self.names[name]:
+            del self.names[name]
+
+    def _subtree(self, path: str) -> List[str]:
+        prefix = path + "/"
+        return [fid for fid, p in self.paths.items() if p == path or p.startswith(prefix)]
+
+    def remove_subtree(self, path: str):
+        for folder_id in self._subtree(path):
+            self.remove(folder_id)
+
+    def rename_subtree(self, old_path: str, new_path: str):
+        for folder_id in self._subtree(old_path):
+            self.add(folder_id, new_path + self.paths[folder_id][len(old_path):])
+
+    def record_use(self, folder_id: str, timestamp: Optional[float] = None):
+        count, _ = self.usage.get(folder_id, (0, 0.0))
+        self.usage[folder_id] = (count + 1, timestamp or time.time())
+
+    def _score(self, folder_id: str, query: str, now: float) -> float:
+        lower_path = self.lower_paths[folder_id]
+        segments = lower_path.split("/")
+        score = 0.0
+        if segments[-1] == query or lower_path == query or lower_path.endswith("/" + query):
+            score += 100
+        elif query in segments:
+            score += 60
+        elif query in segments[-1]:
+            score += 30
+        score -= 2 * len(segments)
+        count, last_used = self.usage.get(folder_id, (0, 0.0))
+        if count:
+            score += 10 * math.log1p(count) + 20 * 0.5 ** (max(0.0, now - last_used) / USAGE_HALF_LIFE)
+        return score
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """返回按相关度排序的 (路径, ID) 候选"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        candidates = self.names.get(query)
+        if not candidates:
+            query_grams = self._ngrams(query, sizes=(min(3, len(query)),))
+            postings = sorted((self.grams.get(gram, set()) for gram in query_grams), key=len)
+            if not postings or not postings[0]:
+                return []
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    return []
+            candidates = [fid for fid in candidates if query in self.lower_paths[fid]]
+        now = time.time()
+        scored = heapq.nsmallest(
+            limit,
+            ((-self._score(fid, query, now), self.paths[fid], fid) for fid in candidates),
+        )
+        return [(path, fid) for _, path, fid in scored]
+
+_search_index = FolderSearchIndex()
+
+# 目录 ID -> 完整路径的解析缓存，目录列表发生变化时清空
+_path_cache: Dict[str, str] = {}
+
+_search_index_lock: Optional[asyncio.Lock] = None
+
+def _load_search_rows() -> Tuple[List[tuple], List[tuple]]:
+    folders = storage.query_all(
+        "SELECT folder_id, path FROM root_folders WHERE folder_id != ? AND path IS NOT NULL", (ROOT_FOLDER_ID,)
+    )
+    try:
+        usage = storage.query_all("SELECT folder_id, use_count, last_used FROM folder_usage")
+    except sqlite3.Error as e:
+        logger.warning("读取目录使用历史失败: %s", e)
+        usage = []
+    return folders, usage
+
+async def get_search_index() -> FolderSearchIndex:
+    """获取内存目录索引，首次使用时从本地目录缓存和 folder_usage 加载
+
+    内存索引只在事件循环中读写，数据库线程只负责读出数据行。
+    """
+    global _search_index_lock
+    if _search_index.loaded:
+        return _search_index
+    if _search_index_lock is None:
+        _search_index_lock = asyncio.Lock()
+    async with _search_index_lock:
+        if _search_index.loaded:
+            return _search_index
+        folders, usage = await storage.run(_load_search_rows)
+        for folder_id, path in folders:
+            _search_index.add(folder_id, path)
+        for folder_id, count, last_used in usage:
+            _search_index.usage[folder_id] = (count, last_used)
+        _search_index.loaded = True
+    logger.info("内存目录索引已加载，共 %d 个目录", len(_search_index.paths))
+    return _search_index
+
+def record_folder_use(cursor: sqlite3.Cursor, folder_id: str, folder_name: str, timestamp: Optional[float] = None):
+    """在调用方的事务中记录一次目录使用，更新 folder_usage 聚合"""
+    timestamp = timestamp or time.time()
+    cursor.execute(
+        "INSERT INTO folder_usage (folder_id, folder_name, use_count, last_used, recency_score) VALUES (?, ?, 1, ?, ?) "
+        "ON CONFLICT (folder_id) DO UPDATE SET folder_name = excluded.folder_name, use_count = use_count + 1, "
+        "last_used = excluded.last_used, recency_score = recency_score + excluded.recency_score",
+        (folder_id, folder_name, timestamp, storage.usage_weight(timestamp))
+    )
+
+def remember_folder_use(folder_id: str, timestamp: Optional[float] = None):
+    """更新内存索引中的目录使用权重（需在事件循环中调用）"""
+    if _search_index.loaded:
+        _search_index.record_use(folder_id, timestamp)
+
+def get_top_folders(limit: int = 10, ranking: str = COMMON_FOLDERS_RANKING) -> List[Tuple[str, str]]:
+    """按使用次数（count）或最近使用加权（recent）返回最常用的 (目录名称, ID)"""
+    if ranking == "recent":
+        order = "recency_score DESC"
+    else:
+        order = "use_count DESC, last_used DESC"
+    return storage.query_all(f"SELECT folder_name, folder_id FROM folder_usage ORDER BY {order} LIMIT ?", (limit,))
+
+# 子树匹配：path 以 "前缀/" 开头等价于 "前缀/" <= path < "前缀0"（'0' 是 '/' 的下一个字符），可以使用 path 索引
+_SUBTREE_RANGE = "path >= ? || '/' AND path < ? || '0'"
+
+def _store_children(cursor, parent_id: str, parent_path: str, folders: List[dict]) -> List[Tuple[str, str, str]]:
+    """在事务内对比并写入子目录变化，返回需要同步到内存索引的变化 (操作, 参数1, 参数2)"""
+    cursor.execute("SELECT folder_id, path FROM root_folders WHERE parent_id = ?", (parent_id,))
+    existing = dict(cursor.fetchall())
+    seen = set()
+    changes = []
+    for folder in folders:
+        folder_id = str(folder['id'])
+        name = folder['name']
+        path = f"{parent_path}/{name}" if parent_path else name
+        seen.add(folder_id)
+        old_path = existing.get(folder_id)
+        if old_path is None:
+            cursor.execute(
+                "INSERT OR REPLACE INTO root_folders (name, folder_id, parent_id, path, listed_at) VALUES (?, ?, ?, ?, NULL)",
+                (name, folder_id, parent_id, path)
+            )
+            changes.append(("add", folder_id, path))
+        elif old_path != path:
+            # 目录被重命名，同步更新其子树的路径
+            cursor.execute("UPDATE root_folders SET name = ?, path = ? WHERE folder_id = ?", (name, path, folder_id))
+            cursor.execute(
+                f"UPDATE root_folders SET path = ? || substr(path, length(?) + 1) WHERE {_SUBTREE_RANGE}",
+                (path, old_path, old_path, old_path)
+            )
+            changes.append(("rename", old_path, path))
+    for folder_id, old_path in existing.items():
+        if folder_id not in seen:
+            cursor.execute("DELETE FROM root_folders WHERE folder_id = ?", (folder_id,))
+            cursor.execute(f"DELETE FROM root_folders WHERE {_SUBTREE_RANGE}", (old_path, old_path))
+            changes.append(("remove", old_path, ""))
+    return changes
+
+def store_children(parent_id: str, parent_path: str, folders: List[dict]) -> List[Tuple[str, str, str]]:
+    """用一次目录列表结果更新本地目录表：新增/重命名子目录，删除已不存在的子目录及其子树"""
+    now = time.time()
+    with storage.transaction() as cursor:
+        changes = _store_children(cursor, parent_id, parent_path, folders)
+        cursor.execute("UPDATE root_folders SET listed_at = ? WHERE folder_id = ?", (now, parent_id))
+    return changes
+
+def apply_folder_changes(changes: List[Tuple[str, str, str]]):
+    """把 store_children 返回的变化同步到内存索引和路径缓存（需在事件循环中调用，重复应用无副作用）"""
+    if not changes:
+        return
+    if _search_index.loaded:
+        for op, first, second in changes:
+            if op == "add":
+                _search_index.add(first, second)
+            elif op == "rename":
+                _search_index.rename_subtree(first, second)
+            else:
+                _search_index.remove_subtree(first)
+    _path_cache.clear()
+
+async def _store_and_apply(folder_id: str, path: str, folders: List[dict]):
+    apply_folder_changes(await storage.run(store_children, folder_id, path, folders))
+
+async def refresh_folder(client: AsyncApiClient, account_id: str, folder_id: str, path: str) -> Optional[List[dict]]:
+    """重新获取一个目录的子目录并写入索引，失败返回 None"""
+    try:
+        data = await client.list_folders(account_id, folder_id)
+    except httpx.HTTPError as e:
+        logger.error("获取目录失败 (folderId=%s): %s", folder_id, e)
+        return None
+    if not data.get("success"):
+        logger.error("获取目录失败 (folderId=%s): %s", folder_id, data.get("error", "未知错误"))
+        return None
+    folders = data.get("data") or []
+    # 写入提交后必须同步到内存索引：调用方在写入途中取消（如 find_folder_path 找到目标后停止遍历）时，
+    # 写入照常完成并应用变化，只是不再等待
+    await asyncio.shield(_store_and_apply(folder_id, path, folders))
+    return folders
+
+async def crawl_folders(client: AsyncApiClient, account_id: str, roots: List[Tuple[str, str]],
+                        concurrency: int = FOLDER_CRAWL_CONCURRENCY, max_depth: Optional[int] = None,
+                        max_folders: Optional[int] = None) -> AsyncIterator[Tuple[str, str]]:
+    """从 roots [(ID, 路径)] 开始逐层广度优先遍历目录，边遍历边产出 (路径, ID)
+
+    每层的目录列表请求并发执行，同时在途的请求数不超过 concurrency；
+    已访问的目录 ID 会去重；max_depth 限制遍历层数，max_folders 限制产出的目录总数。
+    每次列表结果同时写入本地目录索引；提前停止时取消在途的请求，已开始的写入仍会同步到内存索引。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    visited = {folder_id for folder_id, _ in roots}
+    frontier = list(roots)
+    depth = 0
+    discovered = 0
+
+    async def list_one(folder_id: str, path: str):
+        async with semaphore:
+            return folder_id, path, await refresh_folder(client, account_id, folder_id, path)
+
+    while frontier and (max_depth is None or depth < max_depth):
+        next_frontier = []
+        tasks = [asyncio.ensure_future(list_one(folder_id, path)) for folder_id, path in frontier]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                _, path, children = await next_done
+                for child in children or []:
+                    child_id = str(child['id'])
+                    if child_id in visited:
+                        continue
+                    visited.add(child_id)
+                    child_path = f"{path}/{child['name']}" if path else child['name']
+                    discovered += 1
+                    yield child_path, child_id
+                    if max_folders and discovered >= max_folders:
+                        logger.warning("目录遍历达到数量上限 (%d)，停止遍历", max_folders)
+                        return
+                    next_frontier.append((child_id, child_path))
+        finally:
+            for task in tasks:
+                task.cancel()
+        frontier = next_frontier
+        depth += 1
+
+async def find_folder_path(client: AsyncApiClient, account_id: str, roots: List[Tuple[str, str]], target_folder_id: str,
+                           max_depth: Optional[int] = None) -> Optional[str]:
+    """从 roots 开始遍历查找目标目录，找到后立即停止遍历并返回其完整路径"""
+    crawler = crawl_folders(client, account_id, roots, max_depth=max_depth)
+    try:
+        async for path, folder_id in crawler:
+            if folder_id == target_folder_id:
+                return path
+    finally:
+        await crawler.aclose()
+    return None
+
+def _load_ancestors(folder_id: str) -> List[Tuple[str, str, str]]:
+    """用一次递归查询沿父目录指针读出 (ID, 名称, 父 ID)，从 folder_id 开始向上，到根目录为止"""
+    return storage.query_all(
+        "WITH RECURSIVE chain (folder_id, name, parent_id, depth) AS ("
+        "  SELECT folder_id, name, parent_id, 0 FROM root_folders WHERE folder_id = ?"
+        "  UNION ALL"
+        "  SELECT f.folder_id, f.name, f.parent_id, chain.depth + 1 FROM root_folders f"
+        "  JOIN chain ON f.folder_id = chain.parent_id WHERE chain.parent_id != ? AND chain.depth < ?"
+        ") SELECT folder_id, name, parent_id FROM chain ORDER BY depth",
+        (folder_id, ROOT_FOLDER_ID, MAX_FOLDER_DEPTH)
+    )
+
+async def resolve_folder_path(folder_id: str) -> Optional[str]:
+    """沿本地索引中的父目录指针向上解析完整路径，结果会缓存；链路上缺少祖先目录时返回 None"""
+    if folder_id == ROOT_FOLDER_ID:
+        return ROOT_FOLDER_NAME
+    if folder_id in _path_cache:
+        return _path_cache[folder_id]
+    chain = []
+    prefix = ""
+    for fid, name, parent_id in await storage.run(_load_ancestors, folder_id):
+        if fid in _path_cache:
+            prefix = _path_cache[fid]
+            break
+        if fid in (cid for cid, _ in chain):
+            logger.error("检测到目录父指针循环，目录 ID: %s", fid)
+            return None
+        chain.append((fid, name))
+        if parent_id == ROOT_FOLDER_ID:
+            break
+    else:
+        return None
+    for fid, name in reversed(chain):
+        prefix = f"{prefix}/{name}" if prefix else name
+        _path_cache[fid] = prefix
+    return prefix or None
+
+def get_stale_folders(ttl: int) -> List[Tuple[str, str]]:
+    """返回子目录列表缺失或已过期的目录 (ID, 路径)"""
+    return storage.query_all(
+        "SELECT folder_id, path FROM root_folders WHERE listed_at IS NULL OR listed_at < ?",
+        (time.time() - ttl,)
+    )
+
+async def sync_folder_index(client: AsyncApiClient, account_id: str, ttl: int = FOLDER_INDEX_TTL) -> int:
+    """增量同步目录索引：只重新列出缺失或过期的目录，新发现的子目录会在同一轮中继续展开，返回请求次数"""
+    attempted = set()
+    requests_made = 0
+    while True:
+        # 每一轮并发列出当前所有过期目录（即一层），新发现的子目录在下一轮展开
+        stale = [(fid, path or "") for fid, path in await storage.run(get_stale_folders, ttl) if fid not in attempted]
+        if not stale:
+            break
+        attempted.update(fid for fid, _ in stale)
+        requests_made += len(stale)
+        async for _ in crawl_folders(client, account_id, stale, max_depth=1):
+            pass
+    if requests_made:
+        logger.info("目录索引同步完成，共请求 %d 次目录列表", requests_made)
+    return requests_made
+
+def is_root_listed() -> bool:
+    """根目录是否已列出过"""
+    result = storage.query_one("SELECT listed_at FROM root_folders WHERE folder_id = ?", (ROOT_FOLDER_ID,))
+    return bool(result and result[0] is not None)
+
+def is_index_complete() -> bool:
+    """索引是否已完整建立（所有已知目录的子目录都至少列出过一次）"""
+    return storage.query_one("SELECT 1 FROM root_folders WHERE listed_at IS NULL LIMIT 1") is None
+
+async def search_folders(folder_name: str, limit: int = 10) -> List[Tuple[str, str]]:
+    """在本地索引中按名称模糊查找目录，返回按相关度排序的 (路径, ID) 列表"""
+    return (await get_search_index()).search(folder_name, limit)
+
+def mark_folder_stale(folder_id: str):
+    """标记目录的子目录列表已过期（例如转存后目标目录下新增了文件夹），下次同步时重新获取"""
+    storage.execute("UPDATE root_folders SET listed_at = 0 WHERE folder_id = ? AND listed_at IS NOT NULL", (folder_id,))
@@ -0,0 +1,343 @@
+import os
+import queue
+import atexit
+import asyncio
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 数据库路径，机器人和 create_task.py 共用
+DB_PATH = os.getenv("DB_PATH", "/app/data/messages.db")
+
+# 数据库被其他进程锁定时的等待时间（秒）
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "10"))
+
+# 每个连接缓存的预编译语句数
+STATEMENT_CACHE_SIZE = 256
+
+# folder_usage.recency_score 的半衰期（秒）和基准时间（2024-01-01）
+USAGE_HALF_LIFE = 30 * 86400
+USAGE_SCORE_EPOCH = 1704067200
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated = False
+
+def get_connection() -> sqlite3.Connection:
+    """获取当前线程的长连接，首次使用时打开并启用 WAL
+
+    WAL 模式下读写互不阻塞，机器人和 create_task.py 子进程可以同时访问同一个数据库文件；
+    连接常驻，SQL 文本不变的语句会命中连接内的预编译语句缓存。
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+def close_connection():
+    """关闭当前线程的连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Cursor]:
+    """在一个事务中执行多条语句，正常退出时提交，异常时回滚
+
+    嵌套调用时加入外层事务，由最外层统一提交（后台批量写入依赖这一点）。
+    """
+    conn = get_connection()
+    if getattr(_local, "depth", 0):
+        _local.depth += 1
+        try:
+            yield conn.cursor()
+        finally:
+            _local.depth -= 1
+        return
+    _local.depth = 1
+    try:
+        with conn:
+            yield conn.cursor()
+    finally:
+        _local.depth = 0
+
+def query_one(sql: str, params: Sequence = ()) -> Optional[tuple]:
+    return get_connection().execute(sql, params).fetchone()
+
+def query_all(sql: str, params: Sequence = ()) -> List[tuple]:
+    return get_connection().execute(sql, params).fetchall()
+
+def execute(sql: str, params: Sequence = ()) -> int:
+    """执行单条写语句并提交，返回影响的行数"""
+    with transaction() as cursor:
+        return cursor.execute(sql, params).rowcount
+
+class _Request:
+    """提交给数据库线程的一次调用；future 为 None 表示后台写入，不等待结果"""
+    __slots__ = ("fn", "args", "kwargs", "future", "loop")
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict,
+                 future: Optional[asyncio.Future] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.loop = loop
+
+# 数据库线程每次最多取出的请求数（后台写入在其中合并为一个事务提交）
+DB_WRITE_BATCH = 256
+
+_requests: "queue.Queue[Optional[_Request]]" = queue.Queue()
+_db_thread: Optional[threading.Thread] = None
+_db_thread_lock = threading.Lock()
+
+def _set_future(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def _commit_writes(writes: List[_Request]):
+    """把一批后台写入放进同一个事务提交；失败时逐条重试，避免一条坏数据拖累整批"""
+    if not writes:
+        return
+    try:
+        with transaction():
+            for request in writes:
+                request.fn(*request.args, **request.kwargs)
+        return
+    except Exception as e:
+        if len(writes) == 1:
+            logger.error("后台写入失败 (%s): %s", writes[0].fn.__name__, e)
+            return
+        logger.warning("批量写入失败，逐条重试: %s", e)
+    for request in writes:
+        try:
+            with transaction():
+                request.fn(*request.args, **request.kwargs)
+        except Exception as e:
+            logger.error("后台写入失败 (%s): %s", request.fn.__name__, e)
+
+def _db_thread_main():
+    """数据库线程：按提交顺序执行请求，连续的后台写入合并提交（group commit）"""
+    while True:
+        batch = [_requests.get()]
+        while len(batch) < DB_WRITE_BATCH:
+            try:
+                batch.append(_requests.get_nowait())
+            except queue.Empty:
+                break
+        writes = []
+        for request in batch:
+            if request is None:
+                _commit_writes(writes)
+                close_connection()
+                return
+            if request.future is None:
+                writes.append(request)
+                continue
+            # 读请求之前先提交已排队的写入，保证读到自己之前提交的写
+            _commit_writes(writes)
+            writes = []
+            result, error = None, None
+            try:
+                result = request.fn(*request.args, **request.kwargs)
+            except Exception as e:
+                error = e
+            request.loop.call_soon_threadsafe(_set_future, request.future, result, error)
+        _commit_writes(writes)
+
+def _submit(request: _Request):
+    global _db_thread
+    with _db_thread_lock:
+        if _db_thread is None:
+            _db_thread = threading.Thread(target=_db_thread_main, name="storage", daemon=True)
+            _db_thread.start()
+            atexit.register(_stop_db_thread)
+    _requests.put(request)
+
+def _stop_db_thread():
+    """进程退出前写完队列中的后台写入"""
+    if _db_thread is not None and _db_thread.is_alive():
+        _requests.put(None)
+        _db_thread.join(timeout=DB_BUSY_TIMEOUT)
+
+async def run(fn: Callable, *args, **kwargs) -> Any:
+    """在数据库线程中执行同步存储函数并等待结果，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _submit(_Request(fn, args, kwargs, future, loop))
+    return await future
+
+def write_behind(fn: Callable, *args, **kwargs):
+    """提交后台写入，立即返回；数据库线程会把排队中的写入合并为一个事务提交"""
+    _submit(_Request(fn, args, kwargs))
+
+async def flush():
+    """等待此前提交的后台写入全部提交"""
+    await run(lambda: None)
+
+def usage_weight(timestamp: float) -> float:
+    """一次使用对 recency_score 的贡献：2^((使用时间 - 基准时间) / 半衰期)
+
+    分数只需累加，任意时刻按分数排序都等价于按“每过一个半衰期权重减半”的衰减次数排序，不用定期重算。
+    """
+    return 2.0 ** ((timestamp - USAGE_SCORE_EPOCH) / USAGE_HALF_LIFE)
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> set:
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+
+def _migration_1_baseline(cursor: sqlite3.Cursor):
+    """基础表结构：历史消息、设置、目录索引、转存队列和转存台账
+
+    旧版本数据库没有版本号但可能已有部分表，因此这里全部使用 IF NOT EXISTS 并按列补齐。
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS messages
+                      (id INTEGER PRIMARY KEY,
+                       sender TEXT,
+                       content TEXT,
+                       timestamp TEXT,
+                       target_folder_id TEXT,
+                       target_folder_name TEXT
+                      )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS settings
+                      (key TEXT PRIMARY KEY, value TEXT)''')
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS root_folders (
+            name TEXT NOT NULL,
+            folder_id TEXT NOT NULL,
+            parent_id TEXT NOT NULL,
+            path TEXT,
+            listed_at REAL,
+            PRIMARY KEY (folder_id)
+        )
+    """)
+    columns = _columns(cursor, "root_folders")
+    if "path" not in columns:
+        cursor.execute("ALTER TABLE root_folders ADD COLUMN path TEXT")
+        cursor.execute("UPDATE root_folders SET path = name WHERE parent_id = '-11'")
+    if "listed_at" not in columns:
+        cursor.execute("ALTER TABLE root_folders ADD COLUMN listed_at REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_root_folders_parent ON root_folders (parent_id)")
+    cursor.execute("INSERT OR IGNORE INTO root_folders (name, folder_id, parent_id, path, listed_at) VALUES ('', '-11', '', '', NULL)")
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS transfer_jobs
+                      (id INTEGER PRIMARY KEY,
+                       chat_id INTEGER,
+                       message_id INTEGER,
+                       sender TEXT,
+                       content TEXT,
+                       share_link TEXT NOT NULL,
+                       access_code TEXT,
+                       target_folder_id TEXT,
+                       target_folder_name TEXT,
+                       status TEXT NOT NULL,
+                       stage TEXT,
+                       transferred_files INTEGER,
+                       error TEXT,
+                       created_at REAL,
+                       updated_at REAL,
+                       batch_id TEXT
+                      )''')
+    if "batch_id" not in _columns(cursor, "transfer_jobs"):
+        cursor.execute("ALTER TABLE transfer_jobs ADD COLUMN batch_id TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transfer_jobs_status ON transfer_jobs (status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transfer_jobs_batch ON transfer_jobs (batch_id)")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transfer_ledger (
+            id INTEGER PRIMARY KEY,
+            share_link TEXT NOT NULL,
+            access_code TEXT NOT NULL,
+            target_folder_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            transferred_files INTEGER DEFAULT 0,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    """)
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_transfer_ledger_key "
+        "ON transfer_ledger (share_link, access_code, target_folder_id)"
+    )
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transfer_ledger_tasks (
+            task_id TEXT PRIMARY KEY,
+            ledger_id INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transfer_ledger_tasks_ledger ON transfer_ledger_tasks (ledger_id)")
+
+def _migration_2_lookup_indexes(cursor: sqlite3.Cursor):
+    """为按目标目录查历史、按路径前缀更新子树、按列表时间查过期目录建立索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_target_folder ON messages (target_folder_id, target_folder_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_root_folders_path ON root_folders (path)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_root_folders_listed_at ON root_folders (listed_at)")
+
+def _migration_3_folder_usage(cursor: sqlite3.Cursor):
+    """目录使用聚合表 folder_usage（次数、最近使用时间、最近使用加权分数），由历史 messages 回填"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS folder_usage (
+            folder_id TEXT PRIMARY KEY,
+            folder_name TEXT NOT NULL,
+            use_count INTEGER NOT NULL,
+            last_used REAL NOT NULL,
+            recency_score REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_folder_usage_count ON folder_usage (use_count DESC, last_used DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_folder_usage_recency ON folder_usage (recency_score DESC)")
+    usage = {}
+    rows = cursor.execute(
+        "SELECT target_folder_id, target_folder_name, CAST(strftime('%s', timestamp) AS REAL) FROM messages "
+        "WHERE target_folder_id IS NOT NULL AND target_folder_name IS NOT NULL ORDER BY id"
+    ).fetchall()
+    for folder_id, folder_name, timestamp in rows:
+        timestamp = timestamp or 0.0
+        count, _, last_used, score = usage.get(folder_id, (0, "", 0.0, 0.0))
+        usage[folder_id] = (count + 1, folder_name, max(last_used, timestamp), score + usage_weight(timestamp))
+    cursor.executemany(
+        "INSERT OR REPLACE INTO folder_usage (folder_id, use_count, folder_name, last_used, recency_score) VALUES (?, ?, ?, ?, ?)",
+        [(folder_id, *values) for folder_id, values in usage.items()]
+    )
+
+# 按顺序执行的迁移，第 N 个迁移执行后 user_version 为 N；只能追加，不能修改已发布的迁移
+MIGRATIONS: List[Callable[[sqlite3.Cursor], None]] = [
+    _migration_1_baseline,
+    _migration_2_lookup_indexes,
+    _migration_3_folder_usage,
+]
+
+def migrate():
+    """将数据库升级到最新版本，每个进程只检查一次"""
+    global _migrated
+    with _migrate_lock:
+        if _migrated:
+            return
+        conn = get_connection()
+        # BEGIN IMMEDIATE 获取写锁，避免机器人和子进程同时执行同一个迁移
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            cursor = conn.cursor()
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info("执行数据库迁移 %d: %s", number, migration.__doc__.strip().splitlines()[0])
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        _migrated = True
@@ -1,136 +1,665 @@
 #!/usr/local/bin/python3
 
-from webdav3.client import Client
-import sys,os,time,requests
-
-def list_files(webdav_url1, username, password):
-	# 创建WebDAV客户端
-	options = {
-		'webdav_hostname': webdav_url1,
-		'webdav_login': username,
-		'webdav_password': password
-	}
-	
-	client = Client(options)
-	mulu=[]
-	wenjian=[]
+import sys,os,time,json,sqlite3,argparse,hashlib,threading,multiprocessing,requests
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from urllib.parse import quote, unquote, urlsplit
+
+# 同时进行的 PROPFIND 请求数（线程数，也是连接池大小），每个 scan_path 单独计算
+SCAN_CONCURRENCY = int(os.getenv("STRM_SCAN_CONCURRENCY", "8"))
+# 最大扫描层数（根目录为第 1 层），0 表示不限
+MAX_DEPTH = int(os.getenv("STRM_MAX_DEPTH", "0"))
+# 同时扫描的 scan_path 数
+ROOT_CONCURRENCY = int(os.getenv("STRM_ROOT_CONCURRENCY", "2"))
+# 按一级子目录把每个 scan_path 分片到多少个进程处理，默认为 CPU 核数但不超过 4，1 表示不分片；
+# 各分片平分 SCAN_CONCURRENCY（每个分片至少 1 个），每个 scan_path 同时进行的 PROPFIND 数基本不变
+# （分片数变化后各分片的清单随之变化，下次扫描会完整扫描一遍）
+SHARD_PROCESSES = int(os.getenv("STRM_SHARD_PROCESSES", str(min(os.cpu_count() or 1, 4))))
+
+# 写 STRM 文件的线程数
+WRITE_WORKERS = int(os.getenv("STRM_WRITE_WORKERS", "4"))
+# 增量扫描清单目录（SQLite），每个 scan_path 一个文件，记录每个目录的 etag/修改时间和子项
+MANIFEST_DIR = os.getenv("STRM_MANIFEST_DIR", "/app/data/strm_manifest")
+# 设为 1 时忽略清单完整扫描一遍（清单照常更新）
+FULL_SCAN = os.getenv("STRM_FULL_SCAN", "0") == "1"
+# 设为 1 时子目录标识未变化就跳过整个子树，只适用于子目录变化会更新所有上级目录修改时间的后端；
+# 默认每个目录都列一次（多数 WebDAV 后端只更新直接上级目录的修改时间）
+SKIP_SUBTREES = os.getenv("STRM_SKIP_SUBTREES", "0") == "1"
+
+# STRM 文件中的播放地址前缀和本地输出目录
+PLAY_HOST = os.getenv("STRM_PLAY_HOST", "http://xiaoya.host:5678")
+MEDIA_ROOT = os.getenv("STRM_MEDIA_ROOT", "/media/strm")
+
+PROPFIND_BODY = ('<?xml version="1.0" encoding="utf-8"?>'
+	'<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/><d:getlastmodified/><d:getetag/></d:prop></d:propfind>')
+
+def log_line(msg):
+	"""整行输出，多线程同时输出时不会拆行（yabot 按行统计“正在处理”）"""
+	sys.stdout.write(msg + '\n')
+	sys.stdout.flush()
+
+@dataclass
+class ScanConfig:
+	"""一个 scan_path 的扫描配置"""
+	docker_address: str
+	username: str
+	password: str
+	scan_path: str
+	play_host: str = PLAY_HOST
+	media_root: str = MEDIA_ROOT
+
+	@property
+	def webdav_url(self):
+		"""alist WebDAV 地址，以 / 结尾"""
+		return self.docker_address + "/dav" + self.scan_path + "/"
+
+	@property
+	def webdav_url_final(self):
+		"""STRM 文件中的播放地址前缀，以 / 结尾（scan_path 中的空格和 | 已转义）"""
+		return self.play_host + "/d" + self.scan_path.replace(' ', '%20').replace('|', '%7C') + "/"
+
+	@property
+	def save_mulu(self):
+		"""输出路径，例如 /media/strm/电影/，以 / 结尾"""
+		return self.media_root + self.scan_path.replace("%20"," ") + "/"
+
+	def log(self, msg):
+		log_line('[%s] %s' % (self.scan_path.replace("%20"," "), msg))
+
+def normalize_scan_path(scan_path):
+	"""与原 init4.sh 一致：& 转义为 %26"""
+	return scan_path.rstrip().replace('&', '%26')
+
+def parse_strm_txt(path):
+	"""按原 init4.sh 的规则解析 strm.txt，返回 (设置, scan_path 列表)
+
+	包含 scan_path 的每一行是一个扫描路径；docker_address（不区分大小写）、username、password 取第一次出现的行。
+	值为第一个 = 之后的内容，去掉行尾空白。
+	"""
+	settings = {}
+	scan_paths = []
+	with open(path, encoding='utf-8') as f:
+		for line in f:
+			line = line.replace('\r', '').rstrip('\n')
+			if '=' not in line:
+				continue
+			value = line.split('=', 1)[1].rstrip()
+			if 'scan_path' in line:
+				scan_paths.append(normalize_scan_path(value))
+			elif 'docker_address' in line.lower():
+				settings.setdefault('docker_address', value)
+			elif 'username' in line:
+				settings.setdefault('username', value)
+			elif 'password' in line:
+				settings.setdefault('password', value)
+	return settings, scan_paths
+
+def make_session(username, password, pool_size=SCAN_CONCURRENCY):
+	"""创建带认证和 keep-alive 连接池的会话，所有线程共用"""
+	session = requests.Session()
+	session.auth = (username, password)
+	adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	return session
+
+class Manifest:
+	"""远端目录清单：(根地址, 目录相对路径) -> 目录标识（etag + 修改时间）、子目录和文件
+
+	开启 SKIP_SUBTREES 时，子目录的标识与清单一致即认为整个子树未变化，不再列目录。本次扫描的所有改动
+	在同一个事务中，全部 STRM 写入完成后才提交，中途失败不会留下不完整的记录。每个根地址单独一个文件，
+	多个根可以同时扫描。
+	"""
+
+	def __init__(self, directory, root_url):
+		os.makedirs(directory, exist_ok=True)
+		path = os.path.join(directory, hashlib.sha1(root_url.encode('utf-8')).hexdigest()[:16] + '.db')
+		self.conn = sqlite3.connect(path, timeout=30)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS dirs (root TEXT NOT NULL, path TEXT NOT NULL, stamp TEXT NOT NULL, '
+			'subdirs TEXT NOT NULL, files TEXT NOT NULL, PRIMARY KEY (root, path))')
+		self.conn.commit()
+		self.root = root_url
+
+	def stamp(self, path):
+		row = self.conn.execute('SELECT stamp FROM dirs WHERE root = ? AND path = ?', (self.root, path)).fetchone()
+		return row[0] if row else None
+
+	def save(self, path, stamp, subdirs, files):
+		"""记录目录的最新列表，并删除已不存在的子目录的记录"""
+		row = self.conn.execute('SELECT subdirs FROM dirs WHERE root = ? AND path = ?', (self.root, path)).fetchone()
+		if row:
+			for name in set(json.loads(row[0])) - set(subdirs):
+				self._delete_subtree(path + name)
+		self.conn.execute('INSERT OR REPLACE INTO dirs (root, path, stamp, subdirs, files) VALUES (?, ?, ?, ?, ?)',
+			(self.root, path, stamp, json.dumps(subdirs, ensure_ascii=False), json.dumps(files, ensure_ascii=False)))
+
+	def subtree_files(self, path):
+		"""逐个返回清单中 path 子树下所有文件的相对路径"""
+		for dir_path, files in self.conn.execute("SELECT path, files FROM dirs WHERE root = ? AND path >= ? AND path < ?",
+				(self.root, path, path[:-1] + '0')):
+			for name in json.loads(files):
+				yield dir_path + name
+
+	def forget(self, path):
+		"""目录列取失败：删除它及所有上级目录的记录，下次扫描时重新列这条路径"""
+		parents = [''] + [path[:i + 1] for i, c in enumerate(path) if c == '/']
+		self.conn.executemany('DELETE FROM dirs WHERE root = ? AND path = ?', [(self.root, p) for p in parents])
+		self._delete_subtree(path)
+
+	def _delete_subtree(self, path):
+		if not path:
+			self.conn.execute("DELETE FROM dirs WHERE root = ?", (self.root,))
+			return
+		# path 以 / 结尾，'0' 是 '/' 的下一个字符，范围内即该目录及其所有子目录
+		self.conn.execute("DELETE FROM dirs WHERE root = ? AND path >= ? AND path < ?", (self.root, path, path[:-1] + '0'))
+
+	def commit(self):
+		self.conn.commit()
+
+	def close(self):
+		self.conn.close()
+
+def dav_stamp(item):
+	"""目录标识：etag + 修改时间，两者都没有时返回空串（不参与跳过）"""
+	etag = item.findtext('.//{DAV:}getetag') or ''
+	modified = item.findtext('.//{DAV:}getlastmodified') or ''
+	return etag + '|' + modified if etag or modified else ''
+
+def list_files(session, dir_url, log=log_line):
+	"""用一次 PROPFIND (Depth: 1) 列出目录，返回 (子目录, 文件, 目录标识)，列取失败时返回 None
+
+	名称已解码，子目录以 / 结尾；目录标识以名称为键，'' 为目录本身。
+	"""
 	q=1
-	files = []
+	response = None
 	while q<5:
-		try:		   
-		   # 获取WebDAV服务器上的文件列表
-			print("获取", webdav_url1.replace(webdav_url,''), flush=True)
-			files = client.list()
-		except:
+		try:
+			# 获取WebDAV服务器上的文件列表
+			response = session.request('PROPFIND', dir_url, data=PROPFIND_BODY, headers={'Depth': '1'}, timeout=60)
+			response.raise_for_status()
+		except requests.RequestException:
 			q+=1
-			print('连接失败，2秒后重试...')
+			response = None
+			log('连接失败，2秒后重试...')
+			time.sleep(2)
 		else:
 			if q>1:
-				print('重连成功...')
+				log('重连成功...')
 			break
 
-	for file in files[1:]:
-		if file[-1]=='/':
-			mulu.append(file)
+	if response is None:
+		log('列取目录失败：' + unquote(dir_url))
+		return None
+	mulu=[]
+	wenjian=[]
+	stamps={}
+	dir_path = unquote(urlsplit(dir_url).path).rstrip('/')
+	for item in ET.fromstring(response.content).iter('{DAV:}response'):
+		href = unquote(urlsplit(item.findtext('{DAV:}href', '')).path).rstrip('/')
+		if not href:
+			continue
+		if href == dir_path:
+			stamps[''] = dav_stamp(item)
+			continue
+		name = href.rsplit('/', 1)[-1]
+		if item.find('.//{DAV:}resourcetype/{DAV:}collection') is not None:
+			mulu.append(name + '/')
+			stamps[name + '/'] = dav_stamp(item)
 		else:
-			wenjian.append(file)
-	return mulu,wenjian
-
-
-# 输入WebDAV地址、用户名和密码
-webdav_url = "DOCKER_ADDRESS" + "/dav" + "SCAN_PATH" + "/"   #alist webdav 地址 记得最后要加 /
-webdav_url_final = "http://xiaoya.host:5678" + "/d" + "SCAN_PATH" + "/"
-save_mulu=r'/media/strm' + "SCAN_PATH".replace("%20"," ") + "/"  #输出路径 例如 /mnt/media/xiaoya/电影/ 记得最后要加 /
-username = "USERNAME"  #用户名
-password = "PASSWORD"  #密码
-
-l_0, l_1=list_files(webdav_url, username, password)
-#scan_result_file = "scan_result"+ save_mulu.replace("/",".").replace(":\\","_").replace("\\","_").replace(" ","_").replace("__","_") + "txt"
-current_timestamp = time.time()
-time_string = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(current_timestamp))
-scan_result_file = time_string + ".txt"
-if not os.path.exists(scan_result_file):
-    url_1=[webdav_url]
-    url_2=[]
-    url_3=[]
-    url_4=[]    
-    url_5=[]     
-    wenjian_1=[webdav_url + str(k) for k in l_1]
-    wenjian_2=[]
-    wenjian_3=[]
-    wenjian_4=[]    
-    wenjian_5=[]     
-    if l_0 !=[]:
-        for u in l_0:
-            url_2.append(webdav_url+u)
-            wenjian_2+=[webdav_url+u+str(i) for i in list_files(webdav_url+u, username, password)[1]]
-        for x in url_2:
-            l_x=list_files(x, username, password)[0]
-            if l_x !=[]:
-                for y in l_x:
-                    url_3.append(x+y)
-                    wenjian_3+=[x+y+str(j) for j in list_files(x+y, username, password)[1]]
-                    L_y = list_files(x+y, username, password)[0]
-                    if L_y !=[]:
-                        for z in L_y:
-                            url_4.append(x+y+z)
-                            wenjian_4+=[x+y+z+str(j) for j in list_files(x+y+z, username, password)[1]]
-                            L_z = list_files(x+y+z, username, password)[0]
-                            if L_z !=[]:
-                                for v in L_z:
-                                    url_5.append(x+y+z+v)
-                                    wenjian_5+=[x+y+z+v+str(j) for j in list_files(x+y+z+v, username, password)[1]]
-    url=url_1+url_2+url_3+url_4+url_5
-    wenjian_all=wenjian_1+wenjian_2+wenjian_3+wenjian_4+wenjian_5
-    with open(scan_result_file, "w") as f:
-        for item in wenjian_all:
-            f.write(item + "\n")
-            f.flush()
-else:
-    with open(scan_result_file, "r") as f:
-    	wenjian_all=[line.strip() for line in f.readlines()]
-    f.close()	
-
-for b in wenjian_all:
-	prefix = ".".join(b.replace(webdav_url,'').split(".")[0:-1])
-	ext = b.replace(webdav_url,'').split(".")[-1]
-	strm_file_temp = save_mulu + prefix.replace('%20'," ")
+			wenjian.append(name)
+	return mulu,wenjian,stamps
+
+def iter_files(session, root_url, manifest=None, failed=None, max_depth=MAX_DEPTH,
+		concurrency=SCAN_CONCURRENCY, log=log_line, starts=None, skip_subtrees=SKIP_SUBTREES):
+	"""并发遍历 root_url 下任意深度的目录树，每个目录只列一次，边列边逐个返回文件相对根目录的路径（已解码）
+
+	同时在途的请求数不超过 concurrency；待列目录按深度优先排队，内存占用与库的大小无关。
+	传入 manifest 时记录每个目录的列表；skip_subtrees 为真时跳过标识未变化的子树，其中的文件从清单中
+	读取后照常返回，由调用方与本地快照比对。列取失败或因层数限制未扫描的目录追加到 failed。
+	starts 为 [(相对路径, 层数, 目录标识)]，只遍历这些子树，默认为整个根目录。
+	"""
+	def unchanged(rel, stamp):
+		return manifest is not None and skip_subtrees and not FULL_SCAN and stamp and manifest.stamp(rel) == stamp
+
+	backlog = deque()
+	pending = {}
+	skipped = 0
+	for rel, depth, stamp in starts or [('', 1, None)]:
+		if unchanged(rel, stamp):
+			skipped += 1
+			yield from manifest.subtree_files(rel)
+			continue
+		backlog.append((rel, depth, stamp))
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		while backlog or pending:
+			while backlog and len(pending) < concurrency:
+				rel, depth, stamp = backlog.pop()
+				pending[pool.submit(list_files, session, root_url + quote(rel), log)] = (rel, depth, stamp)
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				rel, depth, stamp = pending.pop(future)
+				listing = future.result()
+				if listing is None:
+					if manifest is not None:
+						manifest.forget(rel)
+					if failed is not None:
+						failed.append(rel)
+					continue
+				mulu, wenjian, stamps = listing
+				log("获取 " + rel)
+				if not max_depth or depth < max_depth:
+					for name in mulu:
+						child_stamp = stamps.get(name, '')
+						if unchanged(rel + name, child_stamp):
+							skipped += 1
+							yield from manifest.subtree_files(rel + name)
+							continue
+						backlog.append((rel + name, depth + 1, child_stamp))
+				elif mulu:
+					log('已达到最大扫描层数，跳过子目录：' + rel)
+					if failed is not None:
+						failed.append(rel)
+				for name in wenjian:
+					yield rel + name
+				if manifest is not None:
+					manifest.save(rel, stamp if stamp is not None else stamps.get('', ''), mulu, wenjian)
+	if manifest is not None and skip_subtrees:
+		log('未变化、已跳过的目录数：%d' % skipped)
+
+# 需要生成 STRM 的媒体文件扩展名
+MEDIA_EXTS = {'MP4','MKV','ISO','FLV','AVI','TS','WMV','MOV','RM','RMVB','WEBM','WAV','MP3','FLAC','APE','WV','ALAC','M4A','AAC','WMA'}
+# 文件名含特殊符号、无法创建时改用的备用文件名
+TRANSLATION_TABLE = str.maketrans({ ':': ".",  '|': ".",  '$': ".",  '%': ".",  '&': "_", '#':'.', '+':'_', '\\':'.', '{':'.', '}':'.', '\'':'.'})
+
+def strm_target(cfg, rel):
+	"""返回媒体文件对应的 (STRM 路径, 备用路径)，非媒体文件返回 None"""
+	prefix = ".".join(rel.split(".")[0:-1])
+	ext = rel.split(".")[-1]
+	if ext.upper() not in MEDIA_EXTS:
+		return None
+	strm_file_temp = cfg.save_mulu + prefix.replace('%20'," ")
 	if len(strm_file_temp) > 245:
-           strm_file = strm_file_temp[:245] + "_xxx" + "." + 'strm'
+		strm_file = strm_file_temp[:245] + "_xxx" + "." + 'strm'
 	else:
-           strm_file = strm_file_temp + "." + 'strm'
-	if ext.upper() in ['MP4','MKV','ISO','FLV','AVI','TS','WMV','MOV','RM','RMVB','WEBM','WAV','MP3','FLAC','APE','WV','ALAC','M4A','AAC','WMA']:
-		if not os.path.exists(strm_file):
-			print('正在处理：'+b.replace(webdav_url,''), flush=True)
+		strm_file = strm_file_temp + "." + 'strm'
+	return strm_file, strm_file.translate(TRANSLATION_TABLE)
+
+# 播放地址中需要转义的字符，中文等其他字符保持原样。原先 init4.sh 用 sed 只转义了空格和 |，
+# 这里另外转义 %、# 和 ?（否则播放地址会被截断或误解码），文件名含这些字符的已有 STRM 在下次 --reconcile 时会被改写一次
+URL_ESCAPES = str.maketrans({'%': '%25', ' ': '%20', '|': '%7C', '#': '%23', '?': '%3F'})
+
+def strm_content(cfg, rel, fallback=False):
+	"""STRM 文件内容：转义后的播放地址；备用文件名的内容使用 alist 地址"""
+	if fallback:
+		return cfg.webdav_url_final.replace(cfg.play_host, cfg.docker_address, 1) + rel.translate(URL_ESCAPES)
+	return cfg.webdav_url_final + rel.translate(URL_ESCAPES)
+
+def open_strm(path):
+	"""以 777 权限创建（或清空）STRM 文件，原先由 init4.sh 的 chmod -R 完成"""
+	return open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o777), "w", encoding='utf-8')
+
+def snapshot_local(scope):
+	"""用 os.scandir 遍历一次本地目录，返回 (所有 .strm 文件路径, 所有目录路径)
+
+	scope 为 [(目录, 是否包含子目录)]。
+	"""
+	strm_files = set()
+	dirs = set()
+	stack = [(directory.rstrip('/'), recursive) for directory, recursive in scope]
+	while stack:
+		path, recursive = stack.pop()
+		try:
+			entries = os.scandir(path)
+		except OSError:
+			continue
+		dirs.add(path)
+		with entries:
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					if recursive:
+						stack.append((entry.path, True))
+				elif entry.name.endswith('.strm'):
+					strm_files.add(entry.path)
+	return strm_files, dirs
+
+class StrmWriter:
+	"""在小线程池中写 STRM 文件；快照中已有或已创建过的目录不再 makedirs
+
+	排队中的写入不超过线程数的 4 倍，提交时阻塞，内存占用保持平稳。
+	新建的目录和文件权限为 777（进程 umask 设为 0）。写入失败的文件相对路径记在 failed 中。
+	"""
+
+	def __init__(self, cfg, dirs, workers=WRITE_WORKERS):
+		self.cfg = cfg
+		self.dirs = dirs
+		self.failed = []
+		self.dirs_lock = threading.Lock()
+		self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+		self.slots = threading.BoundedSemaphore(max(1, workers) * 4)
+
+	def _ensure_dir(self, path):
+		if path in self.dirs:
+			return
+		with self.dirs_lock:
+			if path not in self.dirs:
+				os.makedirs(path, mode=0o777, exist_ok=True)
+				self.dirs.add(path)
+
+	def _write(self, rel, strm_file, fallback_file):
+		try:
+			self._ensure_dir(os.path.dirname(strm_file))
+			with open_strm(strm_file) as f:
+				f.write(strm_content(self.cfg, rel))
+		except OSError:
 			try:
-				os.makedirs(os.path.dirname(strm_file),exist_ok=True)
-				with open(strm_file,"w",encoding='utf-8') as f:
-					f.write(b.replace(webdav_url,webdav_url_final))
-			except:
-				try:
-					os.makedirs(os.path.dirname(strm_file.replace('：','.')),exist_ok=True)
-					translation_table = str.maketrans({ ':': ".",  '|': ".",  '$': ".",  '%': ".",  '&': "_", '#':'.', '+':'_', '\\':'.', '{':'.', '}':'.', '\'':'.'})
-					with open(strm_file.translate(translation_table),"w",encoding='utf-8') as f:
-						f.write(b.replace('/dav','/d').replace(" ","%20"))
-				except:
-					print(b.replace(webdav_url,'')+'处理失败，文件名包含特殊符号，建议重命名！', flush=True)
+				self._ensure_dir(os.path.dirname(strm_file.replace('：','.')))
+				with open_strm(fallback_file) as f:
+					f.write(strm_content(self.cfg, rel, True))
+			except OSError:
+				self.failed.append(rel)
+				self.cfg.log(rel+'处理失败，文件名包含特殊符号，建议重命名！')
+		finally:
+			self.slots.release()
+
+	def _rewrite(self, path, content):
+		try:
+			with open_strm(path) as f:
+				f.write(content)
+		except OSError as e:
+			self.cfg.log('改写失败：%s (%s)' % (path, e))
+		finally:
+			self.slots.release()
+
+	def write(self, rel, strm_file, fallback_file):
+		"""写入 STRM 文件，失败时改用备用文件名"""
+		self.slots.acquire()
+		self.pool.submit(self._write, rel, strm_file, fallback_file)
+
+	def rewrite(self, path, content):
+		"""改写已有 STRM 文件的内容"""
+		self.slots.acquire()
+		self.pool.submit(self._rewrite, path, content)
+
+	def close(self):
+		"""等待所有写入完成"""
+		self.pool.shutdown(wait=True)
+
+def add_missing(cfg, files, scope=None, write_failed=None):
+	"""只新增本地还没有的 STRM 文件，本地是否存在以扫描前 scope 范围内的快照为准；返回新增数
+
+	写入失败的文件相对路径追加到 write_failed。
+	"""
+	local, dirs = snapshot_local(scope or [(cfg.save_mulu, True)])
+	writer = StrmWriter(cfg, dirs)
+	added = 0
+	try:
+		for rel in files:
+			target = strm_target(cfg, rel)
+			if target is None:
+				continue
+			strm_file, fallback_file = target
+			if strm_file not in local and fallback_file not in local:
+				cfg.log('正在处理：'+rel)
+				added += 1
+				local.add(strm_file)
+				writer.write(rel, strm_file, fallback_file)
+			else:
+				cfg.log('文件已存在：'+strm_file)
+	finally:
+		writer.close()
+		if write_failed is not None:
+			write_failed.extend(writer.failed)
+	return added
+
+def reconcile(cfg, files, failed, dry_run=False, scope=None, quiet=False, write_failed=None):
+	"""对比远端文件和本地 STRM 目录：新增缺少的、改写播放地址变化的、删除远端已不存在的
+
+	本地目录（scope 范围内，默认为整个输出目录）只遍历一次；有目录未能扫描时不删除任何文件。
+	返回 (新增数, 更新数, 删除数)，写入失败的文件相对路径追加到 write_failed。
+	"""
+	local, dirs = snapshot_local(scope or [(cfg.save_mulu, True)])
+	writer = StrmWriter(cfg, dirs)
+	seen = set()
+	added = updated = removed = 0
+	try:
+		for rel in files:
+			target = strm_target(cfg, rel)
+			if target is None:
+				continue
+			strm_file, fallback_file = target
+			if strm_file in seen or fallback_file in seen:
+				continue
+			if strm_file in local or fallback_file not in local:
+				path, content = strm_file, strm_content(cfg, rel)
+			else:
+				path, content = fallback_file, strm_content(cfg, rel, True)
+			seen.add(path)
+			if path not in local:
+				added += 1
+				cfg.log(('将新增：' if dry_run else '正在处理：') + rel)
+				if not dry_run:
+					writer.write(rel, strm_file, fallback_file)
+				continue
+			with open(path, encoding='utf-8', errors='replace') as f:
+				current = f.read().strip()
+			if current == content:
+				continue
+			updated += 1
+			cfg.log(('将更新：' if dry_run else '正在更新：') + rel)
+			if not dry_run:
+				writer.rewrite(path, content)
+	finally:
+		writer.close()
+		if write_failed is not None:
+			write_failed.extend(writer.failed)
+
+	orphans = local - seen
+	if failed and orphans:
+		cfg.log('有 %d 个目录未能扫描，跳过删除 %d 个本地 STRM 文件' % (len(failed), len(orphans)))
+	else:
+		for path in sorted(orphans):
+			removed += 1
+			cfg.log(('将删除：' if dry_run else '删除失效文件：') + path)
+			if not dry_run:
+				os.remove(path)
+				# 顺带删除因此变空的目录
+				parent = os.path.dirname(path)
+				while parent.rstrip('/') != cfg.save_mulu.rstrip('/') and not os.listdir(parent):
+					os.rmdir(parent)
+					parent = os.path.dirname(parent)
+	if not quiet:
+		cfg.log('%s新增 %d，更新 %d，删除 %d' % ('[演练] ' if dry_run else '', added, updated, removed))
+	return added, updated, removed
+
+def print_directories_without_strm(cfg):
+	# 自底向上遍历一次，子树中有 strm 文件的目录记为 True
+	has_strm = {}
+	for root, dirs, files in os.walk(cfg.save_mulu.rstrip('/'), topdown=False):
+		has_strm[root] = any(file.endswith(".strm") for file in files) or any(has_strm.get(os.path.join(root, d), False) for d in dirs)
+	for root in sorted(path for path, found in has_strm.items() if not found):
+		cfg.log("此目录找不到strm文件：" + root)
+
+@dataclass
+class RootResult:
+	"""一个 scan_path 的处理结果"""
+	scan_path: str
+	seconds: float
+	added: int = 0
+	updated: int = 0
+	removed: int = 0
+	failed_dirs: int = 0
+	error: str = ""
+
+def run_scan(cfg, reconcile_mode=False, dry_run=False, scope=None, starts=None, manifest_key='', concurrency=SCAN_CONCURRENCY):
+	"""扫描 WebDAV 并生成 STRM，全部写入完成后才提交清单，写入失败的目录不记入清单（下次重新处理）
+
+	分片扫描时 starts 为本分片的子树，scope 为对应的本地目录，manifest_key 区分各分片的清单文件。
+	返回 (新增数, 更新数, 删除数, 未能扫描的目录数)。
+	"""
+	failed = []
+	write_failed = []
+	session = make_session(cfg.username, cfg.password, concurrency)
+	manifest = Manifest(MANIFEST_DIR, cfg.webdav_url + manifest_key)
+	try:
+		files = iter_files(session, cfg.webdav_url, manifest, failed, concurrency=concurrency, log=cfg.log, starts=starts)
+		if reconcile_mode or dry_run:
+			added, updated, removed = reconcile(cfg, files, failed, dry_run, scope, quiet=manifest_key != '', write_failed=write_failed)
+		else:
+			added, updated, removed = add_missing(cfg, files, scope, write_failed), 0, 0
+		if not dry_run:
+			for rel in write_failed:
+				manifest.forget(rel[:rel.rfind('/') + 1])
+			manifest.commit()
+	finally:
+		manifest.close()
+		session.close()
+	return added, updated, removed, len(failed)
+
+def sync_root(cfg, reconcile_mode=False, dry_run=False, shard_pool=None, shards=1):
+	"""扫描一个 scan_path 并生成 STRM 文件；传入进程池时按一级子目录分片处理"""
+	start = time.time()
+	try:
+		if shard_pool is not None and shards > 1:
+			result = sync_root_sharded(cfg, reconcile_mode, dry_run, shard_pool, shards)
+			if result.error:
+				return result
+			added, updated, removed, failed_dirs = result.added, result.updated, result.removed, result.failed_dirs
 		else:
-			print('文件已存在：'+strm_file, flush=True)	
-print('处理完毕, 检查处理结果....')
+			added, updated, removed, failed_dirs = run_scan(cfg, reconcile_mode, dry_run)
+		cfg.log('处理完毕, 检查处理结果....')
+		print_directories_without_strm(cfg)
+	except Exception as e:
+		cfg.log('处理失败：%s' % e)
+		return RootResult(cfg.scan_path, time.time() - start, error=str(e))
+	return RootResult(cfg.scan_path, time.time() - start, added, updated, removed, failed_dirs)
+
+def local_top_dirs(cfg, name):
+	"""远端一级子目录 name 的 STRM 在本地写入的一级目录名（正常名称和备用名称）"""
+	dirs = []
+	for path in strm_target(cfg, name + '_.mkv'):
+		if path.startswith(cfg.save_mulu):
+			dirs.append(path[len(cfg.save_mulu):].split('/', 1)[0])
+	return dirs
+
+def shard_of(cfg, name, shards):
+	"""按本地备用目录名哈希固定分片：同一子目录每次落在同一分片（清单可复用），
+	写入同一本地目录的几个远端目录也在同一分片，各分片的本地范围互不重叠"""
+	key = local_top_dirs(cfg, name)[0].translate(TRANSLATION_TABLE)
+	return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) % shards
+
+def sync_shard(cfg, shard, shards, starts, reconcile_mode, dry_run):
+	"""在子进程中处理一个分片（若干一级子目录），返回 (新增数, 更新数, 删除数, 未能扫描的目录数)"""
+	os.umask(0)
+	scope = [(cfg.save_mulu + d, True) for d in {d for rel, _, _ in starts for d in local_top_dirs(cfg, rel)}]
+	return run_scan(cfg, reconcile_mode, dry_run, scope, starts, '#shard-%d-of-%d' % (shard, shards),
+		max(1, SCAN_CONCURRENCY // shards))
+
+def sync_root_sharded(cfg, reconcile_mode, dry_run, shard_pool, shards):
+	"""列出根目录后把一级子目录按哈希分给进程池，根目录下的文件在本进程处理，最后合并结果"""
+	start = time.time()
+	session = make_session(cfg.username, cfg.password, 1)
+	try:
+		listing = list_files(session, cfg.webdav_url, cfg.log)
+	finally:
+		session.close()
+	if listing is None:
+		return RootResult(cfg.scan_path, time.time() - start, failed_dirs=1, error='列取根目录失败')
+	mulu, wenjian, stamps = listing
+	cfg.log('根目录下 %d 个子目录，分到 %d 个进程处理' % (len(mulu), shards))
+	buckets = [[] for _ in range(shards)]
+	for name in mulu:
+		buckets[shard_of(cfg, name, shards)].append((name, 2, stamps.get(name, '')))
+	futures = [shard_pool.submit(sync_shard, cfg, i, shards, starts, reconcile_mode, dry_run)
+		for i, starts in enumerate(buckets) if starts]
+
+	# 根目录下的文件；对账时远端已不存在的一级子目录整个作为删除范围
+	scope = [(cfg.save_mulu, False)]
+	totals = [0, 0, 0, 0]
+	if reconcile_mode or dry_run:
+		remote_dirs = {d for name in mulu for d in local_top_dirs(cfg, name)}
+		try:
+			with os.scandir(cfg.save_mulu) as entries:
+				scope += [(entry.path, True) for entry in entries if entry.is_dir(follow_symlinks=False) and entry.name not in remote_dirs]
+		except OSError:
+			pass
+		totals[:3] = reconcile(cfg, iter(wenjian), [], dry_run, scope, quiet=True)
+	else:
+		totals[0] = add_missing(cfg, iter(wenjian), scope)
+
+	errors = []
+	for future in futures:
+		try:
+			for k, value in enumerate(future.result()):
+				totals[k] += value
+		except Exception as e:
+			errors.append(str(e))
+	if errors:
+		cfg.log('分片处理失败：%s' % '；'.join(errors))
+	cfg.log('%s新增 %d，更新 %d，删除 %d' % ('[演练] ' if dry_run else '', totals[0], totals[1], totals[2]))
+	return RootResult(cfg.scan_path, time.time() - start, *totals, error='；'.join(errors))
+
+def run_roots(configs, reconcile_mode=False, dry_run=False, concurrency=ROOT_CONCURRENCY, shards=SHARD_PROCESSES):
+	"""并发处理多个 scan_path，按输入顺序返回每个的 RootResult；所有 scan_path 共用一个分片进程池"""
+	# 用 spawn 启动子进程：此时已有扫描线程和写入线程，fork 出的子进程可能继承被占用的锁而卡死
+	shard_pool = ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context('spawn')) if shards > 1 else None
+	try:
+		with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+			return list(pool.map(lambda cfg: sync_root(cfg, reconcile_mode, dry_run, shard_pool, shards), configs))
+	finally:
+		if shard_pool is not None:
+			shard_pool.shutdown()
+
+def print_summary(results, seconds):
+	log_line('========== 入库汇总 ==========')
+	for r in results:
+		status = '失败：' + r.error if r.error else '新增 %d，更新 %d，删除 %d' % (r.added, r.updated, r.removed)
+		if r.failed_dirs:
+			status += '，未能扫描的目录 %d' % r.failed_dirs
+		log_line('%s：用时 %.2f 秒，%s' % (r.scan_path.replace("%20"," "), r.seconds, status))
+	log_line('共 %d 个扫描路径，总用时 %.2f 秒，新增 %d，更新 %d，删除 %d' % (
+		len(results), seconds, sum(r.added for r in results), sum(r.updated for r in results), sum(r.removed for r in results)))
 
-def check_strm_files(directory):
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".strm"):
-                return True
-    return False
+def load_configs(args):
+	"""合并 strm.txt 和命令行参数，命令行优先；命令行给出 --scan-path 时只扫描这些路径"""
+	settings, scan_paths = {}, []
+	if args.config and os.path.exists(args.config):
+		settings, scan_paths = parse_strm_txt(args.config)
+	elif not args.scan_path:
+		raise SystemExit('错误：%s 不存在' % args.config)
+	docker_address = args.docker_address or settings.get('docker_address', '')
+	username = args.username or settings.get('username', '')
+	password = args.password or settings.get('password', '')
+	if args.scan_path:
+		scan_paths = [normalize_scan_path(p) for p in args.scan_path]
+	if not docker_address or not scan_paths:
+		raise SystemExit('错误：缺少 docker_address 或 scan_path 配置')
+	return [ScanConfig(docker_address, username, password, p, args.play_host, args.media_root) for p in scan_paths]
 
-def print_directories_without_strm(directory):
-    for root, dirs, files in os.walk(directory):
-        if not check_strm_files(root):
-            print("此目录找不到strm文件：",root)
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='扫描 alist WebDAV 生成 STRM 文件')
+	parser.add_argument('--config', default='/strm.txt', help='strm.txt 路径（docker_address、username、password、scan_path）')
+	parser.add_argument('--docker-address', help='alist 地址，覆盖 strm.txt')
+	parser.add_argument('--username', help='alist 用户名，覆盖 strm.txt')
+	parser.add_argument('--password', help='alist 密码，覆盖 strm.txt')
+	parser.add_argument('--scan-path', action='append', help='扫描路径，可重复；指定后不再使用 strm.txt 中的 scan_path')
+	parser.add_argument('--play-host', default=PLAY_HOST, help='STRM 播放地址前缀')
+	parser.add_argument('--media-root', default=MEDIA_ROOT, help='STRM 输出根目录')
+	parser.add_argument('--roots', type=int, default=ROOT_CONCURRENCY, help='同时扫描的 scan_path 数')
+	parser.add_argument('--shards', type=int, default=SHARD_PROCESSES, help='每个 scan_path 按一级子目录分片的进程数，1 表示不分片')
+	parser.add_argument('--reconcile', action='store_true', default=os.getenv("STRM_RECONCILE", "0") == "1",
+		help='对比本地 STRM 目录：更新播放地址变化的文件，删除远端已不存在的文件')
+	parser.add_argument('--dry-run', action='store_true', help='只列出将要新增、更新和删除的文件，不做改动（隐含 --reconcile）')
+	args = parser.parse_args(argv)
 
-directory_to_check =r'/media/strm' + "SCAN_PATH"
+	configs = load_configs(args)
+	os.umask(0)
+	start = time.time()
+	results = run_roots(configs, args.reconcile, args.dry_run, args.roots, args.shards)
+	print_summary(results, time.time() - start)
+	return 1 if any(r.error for r in results) else 0
 
-print_directories_without_strm(directory_to_check)
-sys.exit(0)
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# storage 在导入时读取 DB_PATH，测试使用临时数据库
+_tmp = tempfile.mkdtemp(prefix="yabot-test-")
+os.environ.setdefault("DB_PATH", os.path.join(_tmp, "messages.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def empty_folder_index():
+    """清空本地目录索引，只保留未列出过的根目录"""
+    import folder_index
+    import storage
+
+    storage.migrate()
+    with storage.transaction() as cursor:
+        cursor.execute("DELETE FROM root_folders")
+        cursor.execute("INSERT INTO root_folders (name, folder_id, parent_id, path, listed_at) VALUES ('', '-11', '', '', NULL)")
+    folder_index._path_cache.clear()
+    folder_index._search_index.__init__()
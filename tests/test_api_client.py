@@ -0,0 +1,41 @@
+import asyncio
+
+import httpx
+import pytest
+
+import delete_task
+from api_client import AsyncApiClient
+
+
+def html_client():
+    """登录正常，但所有 API 都返回反向代理的 HTML 错误页（HTTP 200）"""
+
+    def handler(request):
+        if request.url.path == "/api/auth/login":
+            return httpx.Response(200, json={"success": True})
+        return httpx.Response(200, text="<html><body>502 Bad Gateway</body></html>", headers={"Content-Type": "text/html"})
+
+    client = AsyncApiClient("http://server", "user", "pass")
+    client.client = httpx.AsyncClient(base_url="http://server", transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_non_json_response_raises_http_error():
+    async def main():
+        with pytest.raises(httpx.HTTPError):
+            await html_client().list_tasks()
+
+    asyncio.run(main())
+
+
+def test_callers_treat_non_json_response_as_failure():
+    async def main():
+        client = html_client()
+        return (
+            await delete_task.fetch_task_listing(client),
+            await delete_task.delete_task_by_id(client, "7", False),
+        )
+
+    listing, (ok, _) = asyncio.run(main())
+    assert listing is None
+    assert not ok
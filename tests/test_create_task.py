@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import create_task
+import storage
+import transfer_ledger
+
+
+class FolderTreeClient:
+    """按固定目录树返回子目录，记录每个目录被列出的次数"""
+
+    TREE = {
+        "-11": [{"id": "100", "name": "我的转存"}],
+        "100": [{"id": "101", "name": "电影"}, {"id": "102", "name": "电视剧"}],
+        "101": [],
+        "102": [],
+    }
+
+    def __init__(self):
+        self.listed = []
+
+    async def list_folders(self, account_id, folder_id="-11", **kwargs):
+        self.listed.append(folder_id)
+        await asyncio.sleep(0.01)
+        return {"success": True, "data": self.TREE[folder_id]}
+
+
+def test_concurrent_matches_build_the_index_once(empty_folder_index):
+    client = FolderTreeClient()
+
+    async def main():
+        return await asyncio.gather(*(create_task.match_folder_by_name(client, "1", "电影") for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert results == [("我的转存/电影", "101")] * 3
+    assert sorted(client.listed) == sorted(FolderTreeClient.TREE)
+
+
+class FlakyTaskClient:
+    """前几次返回坏响应，之后返回已完成的任务"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+
+    async def list_tasks(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"data": [{"id": 7, "status": "completed", "currentEpisodes": 3}]}
+
+
+def test_poller_survives_bad_responses():
+    client = FlakyTaskClient([json.JSONDecodeError("bad", "", 0), KeyError("data"), ValueError("bad")])
+    poller = create_task.TaskStatusPoller(client, initial_interval=0.001, max_interval=0.001)
+    task, finished = asyncio.run(poller.wait("7", timeout=5))
+    assert finished and task["currentEpisodes"] == 3
+
+
+def test_poller_fails_waiters_when_runner_stops():
+    class SlowClient:
+        async def list_tasks(self):
+            await asyncio.sleep(10)
+
+    async def main():
+        poller = create_task.TaskStatusPoller(SlowClient(), initial_interval=0.001)
+        waiter = asyncio.ensure_future(poller.wait("7", timeout=5))
+        await asyncio.sleep(0.05)
+        poller._runner.cancel()
+        return await asyncio.wait_for(waiter, 1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+
+def test_new_waiter_interrupts_long_poll_interval():
+    class StatusClient:
+        async def list_tasks(self):
+            return {"data": [{"id": 7, "status": "processing"}, {"id": 8, "status": "completed", "currentEpisodes": 1}]}
+
+    async def main():
+        # 第一次轮询后间隔退避到 60 秒
+        poller = create_task.TaskStatusPoller(StatusClient(), initial_interval=0.01, max_interval=60, backoff=6000)
+        first = asyncio.ensure_future(poller.wait("7", timeout=60))
+        await asyncio.sleep(0.1)
+        assert poller._interval == 60
+        second = await asyncio.wait_for(poller.wait("8", timeout=60), 1)
+        poller._runner.cancel()
+        with pytest.raises(RuntimeError):
+            await first
+        return second
+
+    task, finished = asyncio.run(main())
+    assert finished and task["currentEpisodes"] == 1
+
+
+class FakeTaskServer:
+    """模拟转存服务端：记录创建和执行请求，执行后任务按 outcomes 依次完成或失败"""
+
+    def __init__(self, outcomes=("completed",)):
+        self.tasks = {}
+        self.creates = 0
+        self.executed = []
+        self.outcomes = list(outcomes)
+        self.timeout_next_create = False
+
+    async def get_account_id(self):
+        return "1"
+
+    async def parse_share(self, account_id, share_link, access_code):
+        return {"success": True, "data": ["folder"]}
+
+    async def create_task(self, task_data):
+        self.creates += 1
+        task_id = len(self.tasks) + 100
+        task = {"id": task_id, "shareLink": task_data["shareLink"], "targetFolderId": task_data["targetFolderId"], "status": "pending"}
+        self.tasks[task_id] = task
+        if self.timeout_next_create:
+            # 服务端已创建任务，但响应超时
+            self.timeout_next_create = False
+            raise httpx.ReadTimeout("timed out")
+        return {"success": True, "data": [task]}
+
+    async def list_tasks(self):
+        return {"data": list(self.tasks.values())}
+
+    async def execute_task(self, task_id):
+        self.executed.append(task_id)
+        status = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        self.tasks[int(task_id)].update(status=status, currentEpisodes=2)
+        return {"success": True}
+
+
+@pytest.fixture
+def task_server(monkeypatch):
+    storage.migrate()
+    server = FakeTaskServer()
+    monkeypatch.setattr(create_task, "get_async_client", lambda: server)
+    monkeypatch.setattr(create_task, "_status_poller", create_task.TaskStatusPoller(server, initial_interval=0.001, max_interval=0.001))
+    return server
+
+
+def transfer(share_link, max_retries=1):
+    return asyncio.run(create_task.create_transfer(share_link, target_folder_id="-11", max_retries=max_retries, retry_delay=0))
+
+
+def ledger(share_link):
+    return transfer_ledger.lookup(share_link, "", "-11")
+
+
+def test_create_timeout_retry_finds_task_by_share_link(task_server):
+    link = "https://cloud.189.cn/t/ledger1"
+    task_server.timeout_next_create = True
+    result = transfer(link, max_retries=2)
+    assert result.success and result.transferred_files == 2
+    assert task_server.creates == 1
+    assert task_server.executed == ["100"]
+    assert ledger(link).status == transfer_ledger.STATUS_DONE
+
+
+def test_done_transfer_is_skipped(task_server):
+    link = "https://cloud.189.cn/t/ledger2"
+    transfer(link)
+    result = transfer(link)
+    assert result.success and result.skipped and result.transferred_files == 2
+    assert task_server.creates == 1
+    assert task_server.executed == ["100"]
+
+
+def test_missing_server_tasks_are_forgotten_and_recreated(task_server):
+    link = "https://cloud.189.cn/t/ledger3"
+    transfer(link)
+    task_server.tasks.clear()
+    result = transfer(link)
+    assert result.success and not result.skipped
+    assert task_server.creates == 2
+    assert ledger(link).task_ids == ["100"] and ledger(link).status == transfer_ledger.STATUS_DONE
+
+
+def test_failed_transfer_reexecutes_existing_tasks(task_server):
+    link = "https://cloud.189.cn/t/ledger4"
+    task_server.outcomes = ["failed", "completed"]
+    assert not transfer(link).success
+    assert ledger(link).status == transfer_ledger.STATUS_FAILED
+    result = transfer(link)
+    assert result.success and result.task_ids == ["100"]
+    assert task_server.creates == 1
+    assert task_server.executed == ["100", "100"]
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import create_task
+import folder_index
+import storage
+
+
+class NoNetworkClient:
+    """任何请求都会记录下来并失败"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            self.calls.append(name)
+            raise AssertionError(f"unexpected API call: {name}")
+        return call
+
+
+def test_resolve_root_folder_path():
+    assert asyncio.run(folder_index.resolve_folder_path(folder_index.ROOT_FOLDER_ID)) == folder_index.ROOT_FOLDER_NAME
+
+
+def test_root_folder_name_needs_no_api_calls():
+    storage.migrate()
+    client = NoNetworkClient()
+    name = asyncio.run(create_task.get_folder_name_by_id(client, "1", folder_index.ROOT_FOLDER_ID))
+    assert name == folder_index.ROOT_FOLDER_NAME
+    assert client.calls == []
+
+
+def test_resolve_nested_folder_path():
+    storage.migrate()
+    with storage.transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR REPLACE INTO root_folders (name, folder_id, parent_id, path, listed_at) VALUES (?, ?, ?, ?, NULL)",
+            [("我的转存", "100", "-11", "我的转存"), ("电影", "101", "100", "我的转存/电影")],
+        )
+    folder_index._path_cache.clear()
+    assert asyncio.run(folder_index.resolve_folder_path("101")) == "我的转存/电影"
+
+
+def test_listing_cancelled_by_early_stop_still_updates_search_index(empty_folder_index, monkeypatch):
+    class TwoRootsClient:
+        TREE = {"A": [{"id": "201", "name": "目标"}], "B": [{"id": "202", "name": "纪录片"}]}
+
+        async def list_folders(self, account_id, folder_id="-11", **kwargs):
+            if folder_id == "B":
+                await asyncio.sleep(0.02)
+            return {"success": True, "data": self.TREE[folder_id]}
+
+    store_children = folder_index.store_children
+
+    def slow_store_children(parent_id, parent_path, folders):
+        # B 的写入排在 A 之后，找到目标时 B 的写入仍在数据库线程中
+        time.sleep(0.1 if parent_id == "A" else 0.05)
+        return store_children(parent_id, parent_path, folders)
+
+    monkeypatch.setattr(folder_index, "store_children", slow_store_children)
+
+    async def main():
+        await folder_index.get_search_index()
+        path = await folder_index.find_folder_path(TwoRootsClient(), "1", [("A", "A"), ("B", "B")], "201")
+        await storage.flush()
+        await asyncio.sleep(0.01)
+        assert await storage.run(storage.query_one, "SELECT path FROM root_folders WHERE folder_id = '202'") == ("B/纪录片",)
+        return path, await folder_index.search_folders("纪录片")
+
+    path, matches = asyncio.run(main())
+    assert path == "A/目标"
+    assert matches == [("B/纪录片", "202")]
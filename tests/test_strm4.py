@@ -0,0 +1,111 @@
+import hashlib
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import strm4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    return strm4.ScanConfig("http://alist:5244", "user", "pass", "/lib", play_host="http://play", media_root=str(tmp_path))
+
+
+def write_strm(cfg, rel_path, content):
+    path = os.path.join(cfg.save_mulu, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_reconcile_removes_orphans_and_empty_dirs(cfg):
+    kept = write_strm(cfg, "电影/a.strm", strm4.strm_content(cfg, "电影/a.mkv"))
+    orphan = write_strm(cfg, "旧目录/b.strm", strm4.strm_content(cfg, "旧目录/b.mkv"))
+
+    assert strm4.reconcile(cfg, iter(["电影/a.mkv"]), []) == (0, 0, 1)
+    assert os.path.exists(kept)
+    assert not os.path.exists(orphan)
+    assert not os.path.exists(os.path.dirname(orphan))
+
+
+def test_reconcile_dry_run_changes_nothing(cfg):
+    stale = write_strm(cfg, "电影/a.strm", "http://old/电影/a.mkv")
+    orphan = write_strm(cfg, "旧目录/b.strm", "http://old/旧目录/b.mkv")
+
+    assert strm4.reconcile(cfg, iter(["电影/a.mkv", "电影/c.mkv"]), [], dry_run=True) == (1, 1, 1)
+    assert read(stale) == "http://old/电影/a.mkv"
+    assert os.path.exists(orphan)
+    assert not os.path.exists(os.path.join(cfg.save_mulu, "电影/c.strm"))
+
+
+def test_reconcile_keeps_orphans_when_directories_failed(cfg):
+    orphan = write_strm(cfg, "旧目录/b.strm", "http://old/旧目录/b.mkv")
+
+    added, updated, removed = strm4.reconcile(cfg, iter(["电影/a.mkv"]), ["电视剧/"])
+    assert (added, updated, removed) == (1, 0, 0)
+    assert os.path.exists(orphan)
+    assert read(os.path.join(cfg.save_mulu, "电影/a.strm")) == strm4.strm_content(cfg, "电影/a.mkv")
+
+
+def test_reconcile_updates_fallback_name_in_place(cfg):
+    # 之前因特殊符号改用备用文件名写入的 STRM：按备用文件名比对，不新增也不删除
+    rel = "电影/a:b.mkv"
+    strm_file, fallback_file = strm4.strm_target(cfg, rel)
+    write_strm(cfg, os.path.relpath(fallback_file, cfg.save_mulu), "http://old/a.b.mkv")
+
+    assert strm4.reconcile(cfg, iter([rel]), []) == (0, 1, 0)
+    assert read(fallback_file) == strm4.strm_content(cfg, rel, True)
+    assert not os.path.exists(strm_file)
+
+
+def tree_digest(root):
+    digest = hashlib.sha1()
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            digest.update(os.path.relpath(path, root).encode("utf-8"))
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_sharded_reconcile_matches_unsharded(tmp_path):
+    from mock_dav import running_server
+
+    digests = []
+    with running_server(free_port(), "4,2", 2, 0) as address:
+        for shards in (1, 2):
+            media_root = str(tmp_path / ("strm-%d" % shards))
+            cfg = strm4.ScanConfig(address, "", "", "/lib", media_root=media_root)
+            # 远端已不存在的文件和一级目录，以及播放地址已变化的文件
+            write_strm(cfg, "d 0/gone.strm", "http://old/gone.mkv")
+            write_strm(cfg, "旧目录/x.strm", "http://old/x.mkv")
+            write_strm(cfg, "d 1/m 0.strm", "http://old/d 1/m 0.mkv")
+            env = dict(os.environ, STRM_MANIFEST_DIR=str(tmp_path / ("manifest-%d" % shards)))
+            subprocess.run([sys.executable, os.path.join(ROOT, "strm4.py"), "--config", "", "--docker-address", address,
+                            "--scan-path", "/lib", "--media-root", media_root, "--shards", str(shards), "--reconcile"],
+                           env=env, stdout=subprocess.DEVNULL, check=True, timeout=60)
+            assert not os.path.exists(os.path.join(cfg.save_mulu, "d 0/gone.strm"))
+            assert not os.path.exists(os.path.join(cfg.save_mulu, "旧目录"))
+            assert read(os.path.join(cfg.save_mulu, "d 1/m 0.strm")) == strm4.strm_content(cfg, "d 1/m 0.mkv")
+            digests.append(tree_digest(cfg.save_mulu))
+    assert digests[0] == digests[1]
@@ -0,0 +1,44 @@
+import asyncio
+import sqlite3
+
+import transfer_queue
+from create_task import TransferResult
+from transfer_queue import TransferJob, TransferQueue
+
+
+def test_worker_survives_database_errors(monkeypatch):
+    completed = []
+    failing = {"count": 2}
+
+    async def fake_create_transfer(share_link, access_code, target_folder_id, target_folder_name, progress=None):
+        await progress("parse")
+        return TransferResult(True, transferred_files=1)
+
+    def flaky_update_job(*args, **kwargs):
+        # 第一个任务的阶段写入和完成写入都失败
+        if failing["count"]:
+            failing["count"] -= 1
+            raise sqlite3.OperationalError("database is locked")
+
+    async def on_progress(job, stage):
+        pass
+
+    async def on_complete(job, result, seconds):
+        completed.append((job.share_link, result.success))
+
+    monkeypatch.setattr(transfer_queue, "create_transfer", fake_create_transfer)
+    monkeypatch.setattr(transfer_queue, "update_job", flaky_update_job)
+
+    async def main():
+        queue = TransferQueue(on_progress, on_complete, workers=1)
+        await queue.start()
+        jobs = [TransferJob(1, 1, "me", "", link) for link in ("https://cloud.189.cn/t/a", "https://cloud.189.cn/t/b")]
+        await queue.enqueue_many(jobs)
+        await asyncio.wait_for(queue._queue.join(), 5)
+        await queue.stop()
+        return jobs
+
+    jobs = asyncio.run(main())
+    # 第一个任务完成写入失败，仍然回调 on_complete 报告失败
+    assert completed == [("https://cloud.189.cn/t/a", False), ("https://cloud.189.cn/t/b", True)]
+    assert [job.status for job in jobs] == ["failed", "done"]
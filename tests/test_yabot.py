@@ -0,0 +1,196 @@
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import api_client
+import yabot
+from create_task import TransferResult
+from transfer_queue import BatchSummary, TransferJob
+
+LINKS = ["https://cloud.189.cn/t/aaa111", "https://cloud.189.cn/t/bbb222", "https://cloud.189.cn/t/ccc333"]
+
+
+@pytest.mark.parametrize("args, expected", [
+    ([LINKS[0]], ""),
+    ([LINKS[0], "电影"], "电影"),
+    (LINKS + ["电影"], "电影"),
+    (["电影"] + LINKS, ""),
+    ([LINKS[0], "电影", LINKS[1]], ""),
+    ([LINKS[0], "电影", "2023"], ""),
+    (["电影"], "电影"),
+    ([], ""),
+])
+def test_extract_target_folder_name(args, expected):
+    assert yabot.extract_target_folder_name(args) == expected
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    """替换 start_transfers，记录每次调用的 (链接, 目录名称)"""
+    calls = []
+
+    async def fake_start_transfers(chat_id, sender, content, share_links, target_folder_name, context):
+        calls.append((share_links, target_folder_name))
+
+    monkeypatch.setattr(yabot, "start_transfers", fake_start_transfers)
+    monkeypatch.setattr(yabot, "TARGET_CHAT_ID", "1")
+    monkeypatch.setattr(yabot, "TARGET_SENDER", "me")
+    return calls
+
+
+def make_update(text):
+    message = SimpleNamespace(chat_id=1, from_user=SimpleNamespace(username="me"), text=text)
+    return SimpleNamespace(message=message)
+
+
+def test_save_command_folder_after_several_links(captured):
+    args = LINKS + ["电影"]
+    asyncio.run(yabot.save_command(make_update("/save " + " ".join(args)), SimpleNamespace(args=args)))
+    assert captured == [(LINKS, "电影")]
+
+
+def test_transfer_message_folder_after_several_links(captured):
+    text = "转存 " + " ".join(LINKS) + " 电影"
+    asyncio.run(yabot.handle_message(make_update(text), SimpleNamespace(args=[])))
+    assert captured == [(LINKS, "电影")]
+
+
+def test_transfer_message_with_titled_links(captured):
+    text = "转存 1. 流浪地球 " + LINKS[0] + " 2. 满江红 " + LINKS[1]
+    asyncio.run(yabot.handle_message(make_update(text), SimpleNamespace(args=[])))
+    assert captured == [(LINKS[:2], "")]
+
+
+def test_transfer_message_with_titled_links_and_folder(captured):
+    text = "转存 1. 流浪地球 " + LINKS[0] + " 2. 满江红 " + LINKS[1] + " 电影"
+    asyncio.run(yabot.handle_message(make_update(text), SimpleNamespace(args=[])))
+    assert captured == [(LINKS[:2], "电影")]
+
+
+def test_transfer_message_without_folder(captured):
+    text = "转存 " + " ".join(LINKS)
+    asyncio.run(yabot.handle_message(make_update(text), SimpleNamespace(args=[])))
+    assert captured == [(LINKS, "")]
+
+
+class FakeQuery:
+    def __init__(self):
+        self.message = SimpleNamespace(chat_id=1)
+        self.edits = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+@pytest.mark.parametrize("listing, expected", [
+    (None, "❌ 获取任务列表失败，请稍后重试"),
+    (yabot.TaskListing([], {}, 0.0), "❌ 所选任务已不存在，请重新发送删除指令"),
+])
+def test_perform_delete_stops_without_a_listing(monkeypatch, listing, expected):
+    async def fake_get_task_listing(task_name_filter):
+        return listing
+
+    async def fail_delete_tasks(*args, **kwargs):
+        raise AssertionError("delete_tasks should not be called")
+
+    monkeypatch.setattr(yabot, "get_task_listing", fake_get_task_listing)
+    monkeypatch.setattr(yabot, "delete_tasks", fail_delete_tasks)
+    query = FakeQuery()
+    context = SimpleNamespace(user_data={"task_name_filter": "", "delete_cloud": True})
+    state = asyncio.run(yabot.perform_delete(SimpleNamespace(callback_query=query), context, ["1", "2"]))
+    assert state == yabot.ConversationHandler.END
+    assert query.edits == [expected]
+    assert context.user_data == {}
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def test_long_script_does_not_block_other_handlers(captured):
+    """/strm 等长时间运行的脚本执行期间，其他指令仍能立即处理"""
+    bot = FakeBot()
+    context = SimpleNamespace(bot=bot, args=[LINKS[0]])
+
+    async def main():
+        script = asyncio.ensure_future(yabot.run_script(
+            sys.executable, [sys.executable, "-c", "import time; time.sleep(1); print('done')"], 1, context, "入库"))
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        await yabot.save_command(make_update("/save " + LINKS[0]), context)
+        latency = time.monotonic() - start
+        assert not script.done()
+        return latency, await script
+
+    latency, (success, _, output) = asyncio.run(main())
+    assert latency < 0.1
+    assert success and output.strip() == "done"
+    assert captured == [([LINKS[0]], "")]
+
+
+def test_overlong_output_line_kills_the_script(monkeypatch):
+    processes = []
+    create = asyncio.create_subprocess_exec
+
+    async def recording_create(*args, **kwargs):
+        process = await create(*args, **kwargs)
+        processes.append(process)
+        return process
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", recording_create)
+    bot = FakeBot()
+    code = "import sys, time; sys.stdout.write('x' * 200000); sys.stdout.flush(); time.sleep(30)"
+    start = time.monotonic()
+    success, _, _ = asyncio.run(yabot.run_script(sys.executable, [sys.executable, "-c", code], 1, SimpleNamespace(bot=bot), "入库"))
+    assert not success
+    assert time.monotonic() - start < 10
+    assert processes[0].returncode is not None
+    assert bot.sent and bot.sent[0].startswith("❌ 入库失败！")
+
+
+def test_post_shutdown_closes_the_api_client(monkeypatch):
+    monkeypatch.setattr(yabot, "TRANSFER_QUEUE", None)
+
+    async def main():
+        client = api_client.get_async_client()
+        await yabot.post_shutdown(None)
+        return client
+
+    client = asyncio.run(main())
+    assert client.client.is_closed
+    assert api_client._async_client is None
+
+
+def test_batch_summary_edits_never_go_backwards(monkeypatch):
+    summaries = [BatchSummary(3, finished, 0, 0, 1.0, []) for finished in (1, 2, 3)]
+    summaries_read = []
+    edits = []
+
+    class SlowBot:
+        async def edit_message_text(self, text, **kwargs):
+            # 最早的进度编辑最慢，不加控制时旧进度会最后落地
+            await asyncio.sleep(0.05 if "1/3" in text else 0)
+            edits.append(text)
+
+    def fake_get_batch_summary(batch_id):
+        summaries_read.append(batch_id)
+        return summaries[len(summaries_read) - 1]
+
+    monkeypatch.setattr(yabot, "get_batch_summary", fake_get_batch_summary)
+    queue = yabot.build_transfer_queue(SlowBot())
+
+    async def main():
+        jobs = [TransferJob(1, 1, "me", "", link, batch_id="b") for link in LINKS]
+        await asyncio.gather(*(queue.on_complete(job, TransferResult(False), 0) for job in jobs))
+
+    asyncio.run(main())
+    assert len(edits) == 3
+    assert edits[-1].startswith("⚠️ 批量转存完成")
@@ -0,0 +1,83 @@
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+import storage
+
+logger = logging.getLogger(__name__)
+
+# 台账状态：creating（已提交创建请求，结果未知）、created（任务已创建）、done、failed
+STATUS_CREATING = "creating"
+STATUS_CREATED = "created"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+@dataclass
+class LedgerEntry:
+    """一次转存的台账记录，以 (分享链接, 访问码, 目标目录 ID) 为键"""
+    id: int
+    share_link: str
+    access_code: str
+    target_folder_id: str
+    status: str
+    task_ids: List[str] = field(default_factory=list)
+    transferred_files: int = 0
+    error: str = ""
+
+def lookup(share_link: str, access_code: str, target_folder_id: str) -> Optional[LedgerEntry]:
+    """按转存键查询台账"""
+    row = storage.query_one(
+        "SELECT id, status, transferred_files, COALESCE(error, '') FROM transfer_ledger "
+        "WHERE share_link = ? AND access_code = ? AND target_folder_id = ?",
+        (share_link, access_code or "", target_folder_id)
+    )
+    if row is None:
+        return None
+    ledger_id, status, transferred_files, error = row
+    task_ids = [
+        task_id for (task_id,) in
+        storage.query_all("SELECT task_id FROM transfer_ledger_tasks WHERE ledger_id = ? ORDER BY rowid", (ledger_id,))
+    ]
+    return LedgerEntry(ledger_id, share_link, access_code or "", target_folder_id, status, task_ids, transferred_files or 0, error)
+
+def begin(share_link: str, access_code: str, target_folder_id: str) -> int:
+    """在提交创建请求前登记，状态为 creating；返回台账 ID"""
+    now = time.time()
+    with storage.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO transfer_ledger (share_link, access_code, target_folder_id, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (share_link, access_code, target_folder_id) DO UPDATE SET status = excluded.status, "
+            "transferred_files = 0, error = NULL, updated_at = excluded.updated_at",
+            (share_link, access_code or "", target_folder_id, STATUS_CREATING, now, now)
+        )
+        cursor.execute(
+            "SELECT id FROM transfer_ledger WHERE share_link = ? AND access_code = ? AND target_folder_id = ?",
+            (share_link, access_code or "", target_folder_id)
+        )
+        ledger_id = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM transfer_ledger_tasks WHERE ledger_id = ?", (ledger_id,))
+    return ledger_id
+
+def record_tasks(ledger_id: int, task_ids: List[str]):
+    """记录已创建的任务 ID，状态改为 created"""
+    with storage.transaction() as cursor:
+        cursor.execute("UPDATE transfer_ledger SET status = ?, updated_at = ? WHERE id = ?", (STATUS_CREATED, time.time(), ledger_id))
+        cursor.executemany(
+            "INSERT OR REPLACE INTO transfer_ledger_tasks (task_id, ledger_id) VALUES (?, ?)",
+            [(task_id, ledger_id) for task_id in task_ids]
+        )
+
+def finish(ledger_id: int, success: bool, transferred_files: int, error: str = ""):
+    """记录转存结果"""
+    storage.execute(
+        "UPDATE transfer_ledger SET status = ?, transferred_files = ?, error = ?, updated_at = ? WHERE id = ?",
+        (STATUS_DONE if success else STATUS_FAILED, transferred_files, error or None, time.time(), ledger_id)
+    )
+
+def forget(ledger_id: int):
+    """删除台账记录（服务端任务已不存在时）"""
+    with storage.transaction() as cursor:
+        cursor.execute("DELETE FROM transfer_ledger_tasks WHERE ledger_id = ?", (ledger_id,))
+        cursor.execute("DELETE FROM transfer_ledger WHERE id = ?", (ledger_id,))
+    logger.info("已删除转存台账记录 #%s", ledger_id)
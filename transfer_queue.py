@@ -0,0 +1,198 @@
+import asyncio
+import os
+import time
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+from create_task import TransferResult, create_transfer
+import storage
+
+logger = logging.getLogger(__name__)
+
+# 同时执行的转存任务数（工作协程数）
+TRANSFER_WORKERS = int(os.getenv("TRANSFER_WORKERS", "3"))
+
+@dataclass
+class TransferJob:
+    """一条排队中的转存任务"""
+    chat_id: int
+    message_id: int
+    sender: str
+    content: str
+    share_link: str
+    access_code: str = ""
+    target_folder_id: str = ""
+    target_folder_name: str = ""
+    id: Optional[int] = None
+    status: str = "pending"
+    batch_id: str = ""
+
+def insert_jobs(jobs: List[TransferJob]):
+    """在一个事务中写入新任务，并回填任务 ID"""
+    now = time.time()
+    with storage.transaction() as c:
+        for job in jobs:
+            c.execute(
+                "INSERT INTO transfer_jobs (chat_id, message_id, sender, content, share_link, access_code, "
+                "target_folder_id, target_folder_name, status, stage, created_at, updated_at, batch_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job.chat_id, job.message_id, job.sender, job.content, job.share_link, job.access_code,
+                 job.target_folder_id, job.target_folder_name, job.status, now, now, job.batch_id or None)
+            )
+            job.id = c.lastrowid
+
+def update_job(job_id: int, status: str, stage: str, transferred_files: Optional[int] = None, error: Optional[str] = None):
+    """更新任务状态和阶段"""
+    storage.execute(
+        "UPDATE transfer_jobs SET status = ?, stage = ?, transferred_files = COALESCE(?, transferred_files), "
+        "error = COALESCE(?, error), updated_at = ? WHERE id = ?",
+        (status, stage, transferred_files, error, time.time(), job_id)
+    )
+
+def load_unfinished_jobs() -> List[TransferJob]:
+    """读取上次运行时未完成（排队中或执行中）的任务"""
+    rows = storage.query_all(
+        "SELECT chat_id, message_id, sender, content, share_link, access_code, target_folder_id, "
+        "target_folder_name, id, status, COALESCE(batch_id, '') FROM transfer_jobs "
+        "WHERE status IN ('pending', 'running') ORDER BY id"
+    )
+    return [TransferJob(*row) for row in rows]
+
+@dataclass
+class BatchSummary:
+    """一批转存任务的汇总"""
+    total: int
+    finished: int
+    succeeded: int
+    transferred_files: int
+    wall_time: float
+    # (share_link, status, transferred_files, error)，按加入顺序
+    items: List[Tuple[str, str, int, str]]
+
+    @property
+    def done(self) -> bool:
+        return self.finished == self.total
+
+def get_batch_summary(batch_id: str) -> BatchSummary:
+    """汇总同一批次的任务状态，用时为最早入队到最后完成的时间"""
+    rows = storage.query_all(
+        "SELECT share_link, status, COALESCE(transferred_files, 0), COALESCE(error, ''), created_at, updated_at "
+        "FROM transfer_jobs WHERE batch_id = ? ORDER BY id",
+        (batch_id,)
+    )
+    finished = [row for row in rows if row[1] in ("done", "failed")]
+    wall_time = max(row[5] for row in rows) - min(row[4] for row in rows) if rows else 0.0
+    return BatchSummary(
+        total=len(rows),
+        finished=len(finished),
+        succeeded=sum(1 for row in finished if row[1] == "done"),
+        transferred_files=sum(row[2] for row in finished),
+        wall_time=wall_time,
+        items=[row[:4] for row in rows],
+    )
+
+ProgressCallback = Callable[[TransferJob, str], Awaitable[None]]
+CompleteCallback = Callable[[TransferJob, TransferResult, float], Awaitable[None]]
+
+class TransferQueue:
+    """转存任务队列：任务持久化在 SQLite 中，由固定数量的工作协程执行
+
+    工作协程数即全局并发上限；每个阶段（parse → create → execute → done）
+    通过 on_progress 回调通知，完成后调用 on_complete。
+    """
+
+    def __init__(self, on_progress: ProgressCallback, on_complete: CompleteCallback, workers: int = TRANSFER_WORKERS):
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """启动工作协程，并恢复上次未完成的任务"""
+        await storage.run(storage.migrate)
+        self._queue = asyncio.Queue()
+        for job in await storage.run(load_unfinished_jobs):
+            logger.info("恢复未完成的转存任务 #%s: %s", job.id, job.share_link)
+            await self._queue.put(job)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("转存队列已启动，工作协程数: %d，待处理任务数: %d", self.workers, self._queue.qsize())
+
+    async def stop(self):
+        """停止工作协程；执行中的任务保持 running 状态，下次启动时恢复"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, job: TransferJob) -> int:
+        """持久化并加入队列，返回任务 ID"""
+        await self.enqueue_many([job])
+        return job.id
+
+    async def enqueue_many(self, jobs: List[TransferJob]):
+        """批量持久化后再入队，保证批次完整写入后才开始执行"""
+        await storage.run(insert_jobs, jobs)
+        for job in jobs:
+            self._queue.put_nowait(job)
+            logger.info("转存任务 #%s 已加入队列: %s (排队数: %d)", job.id, job.share_link, self._queue.qsize())
+
+    def pending_count(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _notify(self, job: TransferJob, stage: str):
+        try:
+            await storage.run(update_job, job.id, "running", stage)
+        except Exception as e:
+            # 阶段只用于展示，写入失败不影响转存本身
+            logger.error("转存任务 #%s 阶段写入失败: %s", job.id, e)
+        try:
+            await self.on_progress(job, stage)
+        except Exception as e:
+            logger.error("转存任务 #%s 进度通知失败: %s", job.id, e)
+
+    async def _worker(self, worker_id: int):
+        """循环处理任务；单个任务的任何异常（包括数据库错误）都不会让工作协程退出"""
+        while True:
+            job = await self._queue.get()
+            start_time = time.time()
+            try:
+                await self._process(worker_id, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("转存任务 #%s 处理失败: %s", job.id, e)
+                job.status = "failed"
+                error = str(e)
+                try:
+                    await storage.run(update_job, job.id, "failed", "done", None, error)
+                except Exception as e:
+                    logger.error("转存任务 #%s 状态写入失败: %s", job.id, e)
+                try:
+                    await self.on_complete(job, TransferResult(False, error=error), time.time() - start_time)
+                except Exception as e:
+                    logger.error("转存任务 #%s 完成回调失败: %s", job.id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, worker_id: int, job: TransferJob):
+        start_time = time.time()
+        try:
+            logger.info("工作协程 %d 开始处理转存任务 #%s", worker_id, job.id)
+            job.status = "running"
+            result = await create_transfer(
+                job.share_link, job.access_code, job.target_folder_id, job.target_folder_name,
+                progress=lambda stage: self._notify(job, stage)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("转存任务 #%s 执行时发生异常: %s", job.id, e)
+            result = TransferResult(False, error=str(e))
+
+        job.status = "done" if result.success else "failed"
+        await storage.run(update_job, job.id, job.status, "done", result.transferred_files, result.error or None)
+        try:
+            await self.on_complete(job, result, time.time() - start_time)
+        except Exception as e:
+            logger.error("转存任务 #%s 完成回调失败: %s", job.id, e)
@@ -7,6 +7,7 @@
 import sqlite3
 import telegram
 import requests
+import httpx
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -17,14 +18,20 @@ from telegram.ext import (
     ConversationHandler,
     ContextTypes,
 )
-import subprocess
+import asyncio
 import logging
 import os
 import time
 import re
-from typing import List, Dict, Tuple
-from collections import Counter
-from delete_task import login_and_get_tasks, delete_task_by_id
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional
+from delete_task import DELETE_CONCURRENCY, TaskListing, get_task_listing, delete_tasks
+from create_task import TransferResult, init_db as init_folder_db
+from api_client import close_async_client, get_async_client
+from folder_index import get_top_folders, record_folder_use, remember_folder_use
+import storage
+from transfer_queue import BatchSummary, TransferJob, TransferQueue, get_batch_summary
 
 # 配置日志
 def setup_logging():
@@ -56,7 +63,6 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("TOKEN")
 TARGET_CHAT_ID = os.getenv("TARGET_CHAT_ID")
 TARGET_SENDER = os.getenv("TARGET_SENDER")
-DB_PATH = os.getenv("DB_PATH", "/app/data/messages.db")
 SCRIPT_PARAM = os.getenv("SCRIPT_PARAM", "")
 SERVER_URL = os.getenv("SERVER_URL", "http://your-server:3000").rstrip('/')
 USERNAME = os.getenv("USERNAME", "your_username")
@@ -78,81 +84,110 @@ TRIGGER_MESSAGE_COMMON_FOLDERS = "常用目录"
 SELECT_TASKS = 0
 VIEW_FOLDERS = 1
 
+# 转存进度提示
+TRANSFER_STAGE_TEXT = {
+    "parse": "🔍 正在解析分享链接...",
+    "create": "📝 正在创建转存任务...",
+    "execute": "🚀 正在执行转存并等待完成...",
+}
+
+# 天翼云盘分享链接
+SHARE_LINK_PATTERN = re.compile(r"https://cloud\.189\.cn/t/[A-Za-z0-9]+")
+
+# 链接列表文件（.txt）大小上限（字节）
+MAX_LINK_FILE_SIZE = 1024 * 1024
+
+# 后台转存队列（在 post_init 中启动）
+TRANSFER_QUEUE: Optional[TransferQueue] = None
+
+# 批量删除进度消息的最小更新间隔（秒）
+DELETE_PROGRESS_INTERVAL = float(os.getenv("DELETE_PROGRESS_INTERVAL", "2"))
+
 # 每页显示的数量
 TASKS_PER_PAGE = 5
 FOLDERS_PER_PAGE = 5
 
 # 数据库操作函数
 def init_db():
-    """初始化 SQLite 数据库"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS messages 
-                 (id INTEGER PRIMARY KEY, 
-                  sender TEXT, 
-                  content TEXT, 
-                  timestamp TEXT,
-                  target_folder_id TEXT,
-                  target_folder_name TEXT
-                 )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS settings 
-                 (key TEXT PRIMARY KEY, value TEXT)''')
-    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", 
-              ("default_folder_id", DEFAULT_FOLDER_ID))
-    c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", 
-              ("default_folder_path", ""))
-    conn.commit()
-    conn.close()
+    """初始化 SQLite 数据库（执行迁移并写入默认设置）"""
+    storage.migrate()
+    with storage.transaction() as c:
+        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", 
+                  ("default_folder_id", DEFAULT_FOLDER_ID))
+        c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", 
+                  ("default_folder_path", ""))
 
 def load_default_folder():
     """从数据库加载默认目录"""
     global USER_DEFAULT_FOLDER_ID, USER_DEFAULT_FOLDER_PATH
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key = ?", ("default_folder_id",))
-    result = c.fetchone()
+    result = storage.query_one("SELECT value FROM settings WHERE key = ?", ("default_folder_id",))
     if result:
         USER_DEFAULT_FOLDER_ID = result[0]
-    c.execute("SELECT value FROM settings WHERE key = ?", ("default_folder_path",))
-    result = c.fetchone()
+    result = storage.query_one("SELECT value FROM settings WHERE key = ?", ("default_folder_path",))
     if result:
         USER_DEFAULT_FOLDER_PATH = result[0]
-    conn.close()
     logger.info("从数据库加载默认目录: %s (ID: %s)", USER_DEFAULT_FOLDER_PATH or "未设置", USER_DEFAULT_FOLDER_ID)
 
+def _write_default_folder(folder_id: str, folder_path: str):
+    with storage.transaction() as c:
+        c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", 
+                  ("default_folder_id", folder_id))
+        c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", 
+                  ("default_folder_path", folder_path))
+
 def save_default_folder(folder_id: str, folder_path: str):
-    """保存默认目录到数据库"""
+    """保存默认目录：内存立即生效，数据库在后台写入"""
     global USER_DEFAULT_FOLDER_ID, USER_DEFAULT_FOLDER_PATH
     USER_DEFAULT_FOLDER_ID = folder_id
     USER_DEFAULT_FOLDER_PATH = folder_path
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", 
-              ("default_folder_id", folder_id))
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", 
-              ("default_folder_path", folder_path))
-    conn.commit()
-    conn.close()
+    storage.write_behind(_write_default_folder, folder_id, folder_path)
     logger.info("保存默认目录到数据库: %s (ID: %s)", folder_path, folder_id)
 
+def _write_message(sender: str, content: str, target_folder_id: Optional[str], target_folder_name: Optional[str], timestamp: float):
+    with storage.transaction() as c:
+        c.execute(
+            "INSERT INTO messages (sender, content, timestamp, target_folder_id, target_folder_name) "
+            "VALUES (?, ?, datetime(?, 'unixepoch'), ?, ?)",
+            (sender, content, timestamp, target_folder_id, target_folder_name)
+        )
+        if target_folder_id and target_folder_name:
+            record_folder_use(c, target_folder_id, target_folder_name, timestamp)
+
 def save_to_db(sender: str, content: str, target_folder_id: str = None, target_folder_name: str = None):
-    """将消息保存到数据库，并记录目标目录"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO messages (sender, content, timestamp, target_folder_id, target_folder_name) "
-        "VALUES (?, ?, datetime('now'), ?, ?)",
-        (sender, content, target_folder_id, target_folder_name)
-    )
-    conn.commit()
-    conn.close()
+    """将消息保存到数据库，并记录目标目录；写入由数据库线程在后台批量提交，不阻塞事件循环"""
+    timestamp = time.time()
+    storage.write_behind(_write_message, sender, content, target_folder_id, target_folder_name, timestamp)
+    if target_folder_id and target_folder_name:
+        remember_folder_use(target_folder_id, timestamp)
     logger.info("消息已保存到数据库: %s (发送者: %s, 目标目录: %s)", content, sender, target_folder_name or "未指定")
 
-def extract_share_link(message_text: str) -> str:
-    """从消息中提取天翼云盘分享链接"""
-    pattern = r"https://cloud\.189\.cn/t/[A-Za-z0-9]+"
-    match = re.search(pattern, message_text)
-    return match.group(0) if match else None
+def extract_share_links(message_text: str) -> List[str]:
+    """从消息中提取全部天翼云盘分享链接，按出现顺序去重"""
+    return list(dict.fromkeys(SHARE_LINK_PATTERN.findall(message_text)))
+
+def extract_target_folder_name(args: List[str]) -> str:
+    """目标目录名称写在最后一个分享链接之后，且只能有一个参数；链接前后的其他文字（如标题）不视为目录
+
+    参数中没有链接时（如 .txt 文件的说明）按同样规则取唯一的参数。
+    """
+    trailing = args
+    for i, arg in enumerate(args):
+        if SHARE_LINK_PATTERN.search(arg):
+            trailing = args[i + 1:]
+    return trailing[0] if len(trailing) == 1 else ""
+
+async def pick_target_folder(target_folder_name: str) -> str:
+    """未指定目录名称时，依次使用历史常用目录和默认目录"""
+    if target_folder_name:
+        logger.info("指定目标文件夹名称: %s", target_folder_name)
+        return ""
+    common_folders = await get_common_folders(session=requests.Session())
+    if not common_folders:
+        logger.info("没有历史常用目录，使用默认目录 ID: %s", USER_DEFAULT_FOLDER_ID)
+        return USER_DEFAULT_FOLDER_ID
+    _, target_folder_id = common_folders[0]
+    logger.info("未指定文件夹，使用历史常用目录 ID: %s", target_folder_id)
+    return target_folder_id
 
 async def send_limited_message(chat_id: int, text: str, context: telegram.ext.ContextTypes.DEFAULT_TYPE, reply_markup=None):
     """发送消息，限制长度并支持按钮"""
@@ -173,43 +208,39 @@ async def send_limited_message(chat_id: int, text: str, context: telegram.ext.Co
         await context.bot.send_message(chat_id=chat_id, text=f"❌ 发送消息失败！\n错误：{str(e)}")
         return None
 
-async def run_script(script_path: str, script_args: list, chat_id: int, context: telegram.ext.ContextTypes.DEFAULT_TYPE, action_name: str) -> tuple[bool, int, str, str, str]:
-    """运行脚本并返回执行结果、数量统计、输出、目标目录 ID 和目标目录名称"""
+async def run_script(script_path: str, script_args: list, chat_id: int, context: telegram.ext.ContextTypes.DEFAULT_TYPE, action_name: str) -> tuple[bool, int, str]:
+    """运行脚本并返回执行结果、数量统计和输出"""
     start_time = time.time()
     
     if not os.path.exists(script_path):
         logger.error("脚本未找到: %s", script_path)
         await send_limited_message(chat_id, f"❌ 错误：找不到{action_name}脚本！路径: {script_path}", context)
-        return False, 0, "", "", ""
+        return False, 0, ""
 
+    process = None
     try:
-        process = subprocess.Popen(script_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True)
-        output = ""
+        # 使用 asyncio 子进程异步读取输出，避免阻塞事件循环
+        process = await asyncio.create_subprocess_exec(
+            *script_args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        output_lines = []
         while True:
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
+            # 单行超过缓冲上限（64 KiB）时抛出 ValueError，按执行失败处理
+            line = await process.stdout.readline()
+            if not line:
                 break
-            output += line
+            line = line.decode("utf-8", errors="replace")
+            output_lines.append(line)
             logger.info(line.strip())
-        
-        return_code = process.wait()
+        output = "".join(output_lines)
+
+        return_code = await process.wait()
         duration = time.time() - start_time
         
         count = 0
-        target_folder_id = ""
-        target_folder_name = ""
-        if "create_task.py" in script_path:
-            match = re.search(r"所有任务总计转存文件数: (\d+)", output)
-            if match:
-                count = int(match.group(1))
-            folder_match = re.search(r"最终目标目录: (.+) \(ID: (.+)\)", output)
-            if folder_match:
-                target_folder_name = folder_match.group(1)
-                target_folder_id = folder_match.group(2)
-                logger.info("从输出中提取目标目录: %s (ID: %s)", target_folder_name, target_folder_id)
-            else:
-                logger.warning("未从输出中提取到目标目录信息")
-        elif "init4.sh" in script_path:
+        if "init4.sh" in script_path:
             video_extensions = [".mp4", ".mkv", ".avi", ".flv", ".mov", ".wmv"]
             count = sum(
                 1 for line in output.splitlines()
@@ -228,19 +259,15 @@ async def run_script(script_path: str, script_args: list, chat_id: int, context:
                 f"输出：\n{output[:500]}{'...' if len(output) > 500 else ''}"
             )
             await send_limited_message(chat_id, feedback, context)
-            return False, count, output, target_folder_id, target_folder_name
+            return False, count, output
 
         logger.info("脚本 %s 执行成功，耗时 %s 秒，数量: %d", script_path, duration, count)
-        if "create_task.py" in script_path:
-            feedback = f"✅ {action_name}完成！\n⏱️ 用时：{duration:.2f} 秒\n📦 转存文件数：{count}"
-            if target_folder_name:
-                feedback += f"\n📁 目标目录：{target_folder_name} (ID: {target_folder_id})"
-        elif "init4.sh" in script_path:
+        if "init4.sh" in script_path:
             feedback = f"✅ {action_name}完成！\n⏱️ 用时：{duration:.2f} 秒\n📜 生成 STRM 文件数：{count}"
         else:
             feedback = f"✅ {action_name}完成！\n⏱️ 用时：{duration:.2f} 秒"
         await send_limited_message(chat_id, feedback, context)
-        return True, count, output, target_folder_id, target_folder_name
+        return True, count, output
 
     except Exception as e:
         duration = time.time() - start_time
@@ -251,26 +278,177 @@ async def run_script(script_path: str, script_args: list, chat_id: int, context:
             f"错误：{str(e)}"
         )
         await send_limited_message(chat_id, feedback, context)
-        return False, 0, "", "", ""
+        return False, 0, ""
+    finally:
+        # 读取输出出错或被取消时结束子进程并回收，避免残留僵尸进程
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+def format_transfer_feedback(result: TransferResult, duration: float) -> str:
+    """构建转存结果消息"""
+    if result.skipped:
+        feedback = f"♻️ 该链接已转存过，未重复转存\n📦 转存文件数：{result.transferred_files}\n🆔 任务 ID：{', '.join(result.task_ids)}"
+    elif result.success:
+        feedback = f"✅ 转存完成！\n⏱️ 用时：{duration:.2f} 秒\n📦 转存文件数：{result.transferred_files}"
+    else:
+        feedback = f"❌ 转存失败！\n⏱️ 用时：{duration:.2f} 秒\n📦 转存文件数：{result.transferred_files}"
+    if result.target_folder_name:
+        feedback += f"\n📁 目标目录：{result.target_folder_name} (ID: {result.target_folder_id})"
+    if result.error:
+        feedback += f"\n错误：{result.error}"
+    return feedback
+
+async def edit_job_message(bot: telegram.Bot, job: TransferJob, text: str):
+    """编辑转存任务对应的状态消息"""
+    try:
+        await bot.edit_message_text(chat_id=job.chat_id, message_id=job.message_id, text=text[:4096])
+    except telegram.error.TelegramError as e:
+        logger.warning("更新转存任务 #%s 消息失败: %s", job.id, str(e))
+
+def format_batch_summary(summary: BatchSummary, result: TransferResult) -> str:
+    """构建批量转存汇总消息：每个链接的文件数或失败原因，以及总用时"""
+    if not summary.done:
+        return f"📦 批量转存中：已完成 {summary.finished}/{summary.total}，成功 {summary.succeeded}"
+    lines = [
+        f"{'✅' if summary.succeeded == summary.total else '⚠️'} 批量转存完成：成功 {summary.succeeded}/{summary.total}",
+        f"⏱️ 总用时：{summary.wall_time:.2f} 秒",
+        f"📦 转存文件总数：{summary.transferred_files}",
+    ]
+    if result.target_folder_name:
+        lines.append(f"📁 目标目录：{result.target_folder_name} (ID: {result.target_folder_id})")
+    lines.append("")
+    for share_link, status, transferred_files, error in summary.items:
+        if status == "done":
+            lines.append(f"✅ {share_link}：{transferred_files} 个文件")
+        else:
+            lines.append(f"❌ {share_link}：{error or '转存失败'}")
+    return "\n".join(lines)
+
+@dataclass
+class BatchMessageState:
+    """批量转存汇总消息的编辑状态"""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # 汇总消息当前显示的完成数
+    shown: int = 0
+    # 已回调的任务数和批次任务总数，全部回调后清理状态
+    reported: int = 0
+    total: int = 0
+
+def build_transfer_queue(bot: telegram.Bot) -> TransferQueue:
+    """创建转存队列，进度和结果通过编辑同一条消息反馈；批量任务共用一条汇总消息"""
+    batch_states: Dict[str, BatchMessageState] = {}
+
+    async def update_batch_summary(job: TransferJob, result: TransferResult):
+        """同一批次的汇总消息串行编辑，且只显示比上次更新的进度，避免较旧的进度覆盖最终汇总"""
+        state = batch_states.setdefault(job.batch_id, BatchMessageState())
+        async with state.lock:
+            state.reported += 1
+            try:
+                summary = await storage.run(get_batch_summary, job.batch_id)
+                state.total = summary.total
+                if summary.finished > state.shown:
+                    state.shown = summary.finished
+                    await edit_job_message(bot, job, format_batch_summary(summary, result))
+            finally:
+                if state.total and state.reported >= state.total:
+                    batch_states.pop(job.batch_id, None)
+
+    async def on_progress(job: TransferJob, stage: str):
+        if job.batch_id:
+            return
+        await edit_job_message(bot, job, f"⏳ 转存任务 #{job.id}\n🔗 {job.share_link}\n{TRANSFER_STAGE_TEXT.get(stage, stage)}")
+
+    async def on_complete(job: TransferJob, result: TransferResult, duration: float):
+        logger.info("转存任务 #%s %s，耗时 %s 秒，数量: %d", job.id, "成功" if result.success else "失败", duration, result.transferred_files)
+        if job.batch_id:
+            await update_batch_summary(job, result)
+        else:
+            await edit_job_message(bot, job, format_transfer_feedback(result, duration))
+        if result.success and result.target_folder_id and result.target_folder_name:
+            save_to_db(job.sender, job.content, result.target_folder_id, result.target_folder_name)
+        else:
+            logger.warning("转存任务未成功或未获取目标目录信息，不记录到历史")
+
+    return TransferQueue(on_progress, on_complete)
+
+async def enqueue_transfer(chat_id: int, sender: str, content: str, share_link: str, target_folder_id: str, target_folder_name: str,
+                           context: telegram.ext.ContextTypes.DEFAULT_TYPE):
+    """将转存加入后台队列并立即回复，后续进度在同一条消息中更新"""
+    pending = TRANSFER_QUEUE.pending_count()
+    message = await send_limited_message(chat_id, f"🕒 已加入转存队列（前方排队 {pending} 个）\n🔗 {share_link}", context)
+    if message is None:
+        logger.error("无法发送转存队列消息，放弃转存: %s", share_link)
+        return
+    job = TransferJob(chat_id, message.message_id, sender, content, share_link,
+                      target_folder_id=target_folder_id, target_folder_name=target_folder_name)
+    await TRANSFER_QUEUE.enqueue(job)
+
+async def enqueue_batch_transfer(chat_id: int, sender: str, share_links: List[str], target_folder_id: str, target_folder_name: str,
+                                 context: telegram.ext.ContextTypes.DEFAULT_TYPE):
+    """将多个链接作为一批加入队列，并发上限由队列工作协程数决定，全部完成后汇总到同一条消息"""
+    message = await send_limited_message(chat_id, f"🕒 已加入转存队列：共 {len(share_links)} 个链接", context)
+    if message is None:
+        logger.error("无法发送批量转存消息，放弃 %d 个链接", len(share_links))
+        return
+    batch_id = uuid.uuid4().hex
+    jobs = [
+        TransferJob(chat_id, message.message_id, sender, share_link, share_link,
+                    target_folder_id=target_folder_id, target_folder_name=target_folder_name, batch_id=batch_id)
+        for share_link in share_links
+    ]
+    await TRANSFER_QUEUE.enqueue_many(jobs)
+    logger.info("批量转存 %s 已加入队列，链接数: %d", batch_id, len(jobs))
+
+async def start_transfers(chat_id: int, sender: str, content: str, share_links: List[str], target_folder_name: str,
+                          context: telegram.ext.ContextTypes.DEFAULT_TYPE):
+    """按链接数量选择单个转存或批量转存"""
+    target_folder_id = await pick_target_folder(target_folder_name)
+    if len(share_links) == 1:
+        await enqueue_transfer(chat_id, sender, content, share_links[0], target_folder_id, target_folder_name, context)
+    else:
+        await enqueue_batch_transfer(chat_id, sender, share_links, target_folder_id, target_folder_name, context)
+
+async def run_execute_all(chat_id: int, context: telegram.ext.ContextTypes.DEFAULT_TYPE, max_retries: int = 3, retry_delay: int = 5) -> bool:
+    """调用 /api/tasks/executeAll 执行所有任务并反馈结果"""
+    start_time = time.time()
+    client = get_async_client()
+    error = ""
+    for attempt in range(max_retries):
+        logger.info("执行所有任务，尝试第 %s 次...", attempt + 1)
+        try:
+            result = await client.execute_all()
+            if result.get("success"):
+                duration = time.time() - start_time
+                logger.info("任务执行成功: %s", result)
+                await send_limited_message(chat_id, f"✅ 任务执行完成！\n⏱️ 用时：{duration:.2f} 秒", context)
+                return True
+            error = result.get("error", "未知错误")
+        except httpx.HTTPError as e:
+            error = str(e)
+        logger.error("任务执行失败: %s", error)
+        if attempt < max_retries - 1:
+            await asyncio.sleep(retry_delay)
+
+    duration = time.time() - start_time
+    await send_limited_message(chat_id, f"❌ 任务执行失败！\n⏱️ 用时：{duration:.2f} 秒\n错误：{error}", context)
+    return False
 
-def get_common_folders(session: requests.Session) -> List[Tuple[str, str]]:
-    """从历史转存记录中提取前 10 个最常用目录"""
+async def get_common_folders(session: requests.Session) -> List[Tuple[str, str]]:
+    """从目录使用统计中取前 10 个最常用目录，排序方式由 COMMON_FOLDERS_RANKING 决定"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT target_folder_id, target_folder_name FROM messages WHERE target_folder_id IS NOT NULL AND target_folder_name IS NOT NULL")
-        folder_records = c.fetchall()
-        conn.close()
+        common_folders = await storage.run(get_top_folders, 10)
     except sqlite3.Error as e:
         logger.error("读取历史记录失败: %s", e)
         return []
 
-    if not folder_records:
+    if not common_folders:
         logger.info("没有历史转存记录，返回空列表")
         return []
 
-    folder_counts = Counter((folder_id, folder_name) for folder_id, folder_name in folder_records)
-    common_folders = [(name, folder_id) for (folder_id, name), count in folder_counts.most_common(10)]
     logger.info("常用目录（基于历史记录）: %s", common_folders)
     return common_folders
 
@@ -288,7 +466,7 @@ async def handle_message(update: telegram.Update, context: telegram.ext.ContextT
 
     if message_text == TRIGGER_MESSAGE_STRM:
         logger.info("触发 STRM 生成: %s (来自: @%s)", message_text, sender_username)
-        success, count, output, _, _ = await run_script(
+        success, count, output = await run_script(
             "/app/init4.sh",
             ["/bin/bash", "/app/init4.sh", SCRIPT_PARAM],
             chat_id,
@@ -300,49 +478,19 @@ async def handle_message(update: telegram.Update, context: telegram.ext.ContextT
     elif message_text.startswith(TRIGGER_MESSAGE_TRANSFER):
         logger.info("检测到转存关键词: %s (来自: @%s)", message_text, sender_username)
         parts = message_text.split()
-        share_link = extract_share_link(message_text)
-        if not share_link:
+        share_links = extract_share_links(message_text)
+        if not share_links:
             logger.error("未找到有效的天翼云盘分享链接")
             await send_limited_message(chat_id, "❌ 错误：请提供有效的天翼云盘分享链接！", context)
             return
         
-        target_folder_name = parts[2] if len(parts) > 2 else ""
-        target_folder_id = None
-        if target_folder_name:
-            logger.info("指定目标文件夹名称: %s", target_folder_name)
-            script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-name", target_folder_name]
-        else:
-            common_folders = get_common_folders(session=requests.Session())
-            if not common_folders:
-                logger.info("没有历史常用目录，使用默认目录 ID: %s", USER_DEFAULT_FOLDER_ID)
-                target_folder_id = USER_DEFAULT_FOLDER_ID
-                script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-id", target_folder_id]
-            else:
-                _, target_folder_id = common_folders[0]
-                logger.info("未指定文件夹，使用历史常用目录 ID: %s", target_folder_id)
-                script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-id", target_folder_id]
-
-        success, count, output, final_target_folder_id, final_target_folder_name = await run_script(
-            "/app/create_task.py",
-            script_args,
-            chat_id,
-            context,
-            "转存"
-        )
-        if success and final_target_folder_id and final_target_folder_name:
-            save_to_db(sender_username, message_text, final_target_folder_id, final_target_folder_name)
-        else:
-            logger.warning("转存任务未成功或未获取目标目录信息，不记录到历史")
+        # 转存 <链接...> [目录]
+        target_folder_name = extract_target_folder_name(parts[1:])
+        await start_transfers(chat_id, sender_username, message_text, share_links, target_folder_name, context)
 
     elif message_text == TRIGGER_MESSAGE_EXECUTE:
         logger.info("触发任务执行: %s (来自: @%s)", message_text, sender_username)
-        success, count, output, _, _ = await run_script(
-            "/app/execute_tasks.py",
-            ["python", "/app/execute_tasks.py"],
-            chat_id,
-            context,
-            "任务执行"
-        )
+        await run_execute_all(chat_id, context)
         save_to_db(sender_username, message_text)
 
     elif message_text == TRIGGER_MESSAGE_DELETE:
@@ -368,38 +516,46 @@ async def save_command(update: telegram.Update, context: telegram.ext.ContextTyp
         await send_limited_message(chat_id, "❌ 错误：请提供分享链接，例如 /save <链接> [目录]", context)
         return
     
-    share_link = extract_share_link(" ".join(args))
-    if not share_link:
+    share_links = extract_share_links(" ".join(args))
+    if not share_links:
         await send_limited_message(chat_id, "❌ 错误：请提供有效的天翼云盘分享链接！", context)
         return
     
-    target_folder_name = args[1] if len(args) > 1 else ""
-    target_folder_id = None
-    if target_folder_name:
-        logger.info("命令指定目标文件夹名称: %s", target_folder_name)
-        script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-name", target_folder_name]
-    else:
-        common_folders = get_common_folders(session=requests.Session())
-        if not common_folders:
-            logger.info("命令未指定文件夹，且没有历史常用目录，使用默认目录 ID: %s", USER_DEFAULT_FOLDER_ID)
-            target_folder_id = USER_DEFAULT_FOLDER_ID
-            script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-id", target_folder_id]
-        else:
-            _, target_folder_id = common_folders[0]
-            logger.info("命令未指定文件夹，使用历史常用目录 ID: %s", target_folder_id)
-            script_args = ["python", "/app/create_task.py", "--share-link", share_link, "--target-folder-id", target_folder_id]
-    
-    success, count, output, final_target_folder_id, final_target_folder_name = await run_script(
-        "/app/create_task.py",
-        script_args,
-        chat_id,
-        context,
-        "转存"
-    )
-    if success and final_target_folder_id and final_target_folder_name:
-        save_to_db(sender_username, " ".join(args), final_target_folder_id, final_target_folder_name)
-    else:
-        logger.warning("转存任务未成功或未获取目标目录信息，不记录到历史")
+    target_folder_name = extract_target_folder_name(args)
+    await start_transfers(chat_id, sender_username, " ".join(args), share_links, target_folder_name, context)
+
+async def link_file_handler(update: telegram.Update, context: telegram.ext.ContextTypes.DEFAULT_TYPE):
+    """处理附带分享链接列表的 .txt 文件，文件说明可为空或写 转存 [目录]、/save [目录]"""
+    chat_id = update.message.chat_id
+    sender_username = update.message.from_user.username or "未知用户"
+    document = update.message.document
+    caption = (update.message.caption or "").split()
+
+    if chat_id != int(TARGET_CHAT_ID) or sender_username != TARGET_SENDER:
+        logger.info("文件消息不符合条件: Chat ID %s 或发送者 @%s 不匹配", chat_id, sender_username)
+        return
+    if caption and caption[0] not in (TRIGGER_MESSAGE_TRANSFER, "/save"):
+        logger.info("文件说明不是转存指令，忽略: %s", update.message.caption)
+        return
+
+    logger.info("收到链接列表文件: %s (来自: @%s)", document.file_name, sender_username)
+    if document.file_size and document.file_size > MAX_LINK_FILE_SIZE:
+        await send_limited_message(chat_id, f"❌ 错误：链接文件过大（上限 {MAX_LINK_FILE_SIZE // 1024} KB）", context)
+        return
+    try:
+        file = await document.get_file()
+        content = (await file.download_as_bytearray()).decode("utf-8", errors="ignore")
+    except telegram.error.TelegramError as e:
+        logger.error("下载链接文件失败: %s", str(e))
+        await send_limited_message(chat_id, f"❌ 下载链接文件失败！\n错误：{str(e)}", context)
+        return
+
+    share_links = extract_share_links(content)
+    if not share_links:
+        await send_limited_message(chat_id, "❌ 错误：文件中没有有效的天翼云盘分享链接！", context)
+        return
+    target_folder_name = extract_target_folder_name(caption[1:])
+    await start_transfers(chat_id, sender_username, content, share_links, target_folder_name, context)
 
 async def strm_command(update: telegram.Update, context: telegram.ext.ContextTypes.DEFAULT_TYPE):
     """处理 /strm 命令"""
@@ -411,7 +567,7 @@ async def strm_command(update: telegram.Update, context: telegram.ext.ContextTyp
         return
     
     logger.info("收到命令: /strm (来自: @%s)", sender_username)
-    success, count, output, _, _ = await run_script(
+    success, count, output = await run_script(
         "/app/init4.sh",
         ["/bin/bash", "/app/init4.sh", SCRIPT_PARAM],
         chat_id,
@@ -430,26 +586,19 @@ async def execute_command(update: telegram.Update, context: telegram.ext.Context
         return
     
     logger.info("收到命令: /execute (来自: @%s)", sender_username)
-    success, count, output, _, _ = await run_script(
-        "/app/execute_tasks.py",
-        ["python", "/app/execute_tasks.py"],
-        chat_id,
-        context,
-        "任务执行"
-    )
+    await run_execute_all(chat_id, context)
     save_to_db(sender_username, "/execute")
 
-def build_task_list_message(tasks: List[Dict], page: int, tasks_per_page: int, selected_tasks: set) -> tuple[str, InlineKeyboardMarkup]:
-    """构建任务列表消息和按钮"""
-    total_tasks = len(tasks)
+def build_task_list_message(listing: TaskListing, page: int, tasks_per_page: int, selected_tasks: set) -> tuple[str, InlineKeyboardMarkup]:
+    """构建任务列表消息和按钮，只生成当前页"""
+    total_tasks = len(listing)
+    page = max(0, min(page, (total_tasks - 1) // tasks_per_page)) if total_tasks else 0
+    page_tasks = listing.page(page, tasks_per_page)
     start_idx = page * tasks_per_page
-    end_idx = min(start_idx + tasks_per_page, total_tasks)
+    end_idx = start_idx + len(page_tasks)
     task_list_message = "🎉 当前任务列表：\n\n"
     
-    for idx, task in enumerate(tasks[start_idx:end_idx], start_idx + 1):
-        resource_name = task.get("resourceName", "")
-        share_folder_name = task.get("shareFolderName", "")
-        full_name = f"{resource_name}/{share_folder_name}" if share_folder_name else resource_name
+    for idx, (task_id, full_name) in enumerate(page_tasks, start_idx + 1):
         display_name = full_name[:30] + "..." if len(full_name) > 30 else full_name
         task_list_message += f"{idx}. {display_name}\n"
     
@@ -457,8 +606,7 @@ def build_task_list_message(tasks: List[Dict], page: int, tasks_per_page: int, s
     task_list_message += "\n点击下方按钮选择任务（支持多选），完成后点击“确认删除”。" 
 
     buttons = []
-    for idx, task in enumerate(tasks[start_idx:end_idx], start_idx):
-        task_id = str(task.get("id"))
+    for idx, (task_id, _) in enumerate(page_tasks, start_idx):
         is_selected = task_id in selected_tasks
         button_text = f"✅ {start_idx + 1 + (idx - start_idx)}" if is_selected else f"{start_idx + 1 + (idx - start_idx)}"
         buttons.append(
@@ -512,24 +660,23 @@ async def delete_command(update: telegram.Update, context: telegram.ext.ContextT
         else:
             i += 1
 
-    session, tasks, success = login_and_get_tasks(task_name)
-    if not success:
+    listing = await get_task_listing(task_name)
+    if listing is None:
         await send_limited_message(chat_id, "❌ 获取任务列表失败，请稍后重试", context)
         return ConversationHandler.END
-    if not tasks:
+    if not listing:
         await send_limited_message(chat_id, "🎉 当前任务列表为空，无任务可删除", context)
         return ConversationHandler.END
 
+    # 会话中只保存筛选条件、已选任务 ID 和当前页，任务列表由共享缓存提供
     page = 0
     selected_tasks = set()
-    context.user_data["tasks"] = tasks
-    context.user_data["session"] = session
+    context.user_data["task_name_filter"] = task_name
     context.user_data["delete_cloud"] = delete_cloud
     context.user_data["page"] = page
     context.user_data["selected_tasks"] = selected_tasks
-    context.user_data["task_name_filter"] = task_name
 
-    task_list_message, reply_markup = build_task_list_message(tasks, page, TASKS_PER_PAGE, selected_tasks)
+    task_list_message, reply_markup = build_task_list_message(listing, page, TASKS_PER_PAGE, selected_tasks)
     task_list_message += f"\n当前设置：{'同时删除网盘内容' if delete_cloud else '仅删除任务，不删除网盘内容'}"
     if task_name:
         task_list_message += f"\n筛选条件：任务名称包含 '{task_name}'"
@@ -597,7 +744,7 @@ async def common_folders_command(update: telegram.Update, context: telegram.ext.
     logger.info("收到命令: /commonfolders (来自: @%s)", sender_username)
 
     session = requests.Session()
-    common_folders = get_common_folders(session)
+    common_folders = await get_common_folders(session)
     if not common_folders:
         await send_limited_message(chat_id, "❌ 没有历史转存记录，无法获取常用目录", context)
         return ConversationHandler.END
@@ -625,9 +772,7 @@ async def button_handler(update: telegram.Update, context: telegram.ext.ContextT
     chat_id = query.message.chat_id
     message_id = query.message.message_id
 
-    if "tasks" in context.user_data:
-        tasks = context.user_data.get("tasks", [])
-        session = context.user_data.get("session")
+    if "task_name_filter" in context.user_data:
         delete_cloud = context.user_data.get("delete_cloud", True)
         page = context.user_data.get("page", 0)
         selected_tasks = context.user_data.get("selected_tasks", set())
@@ -658,9 +803,13 @@ async def button_handler(update: telegram.Update, context: telegram.ext.ContextT
             return await perform_delete(update, context, list(selected_tasks))
 
         elif data == "delete_all":
-            selected_tasks = {str(task.get("id")) for task in tasks}
-            logger.info("用户选择全部删除，任务数量: %d", len(selected_tasks))
-            return await perform_delete(update, context, list(selected_tasks))
+            listing = await get_task_listing(task_name_filter)
+            if listing is None:
+                await query.edit_message_text("❌ 获取任务列表失败，请稍后重试")
+                context.user_data.clear()
+                return ConversationHandler.END
+            logger.info("用户选择全部删除，任务数量: %d", len(listing))
+            return await perform_delete(update, context, list(listing.task_ids))
 
         elif data == "cancel":
             await query.edit_message_text("❌ 删除操作已取消")
@@ -668,7 +817,12 @@ async def button_handler(update: telegram.Update, context: telegram.ext.ContextT
             context.user_data.clear()
             return ConversationHandler.END
 
-        task_list_message, reply_markup = build_task_list_message(tasks, page, TASKS_PER_PAGE, selected_tasks)
+        listing = await get_task_listing(task_name_filter)
+        if listing is None:
+            await query.edit_message_text("❌ 获取任务列表失败，请稍后重试")
+            context.user_data.clear()
+            return ConversationHandler.END
+        task_list_message, reply_markup = build_task_list_message(listing, page, TASKS_PER_PAGE, selected_tasks)
         task_list_message += f"\n当前设置：{'同时删除网盘内容' if delete_cloud else '仅删除任务，不删除网盘内容'}"
         if task_name_filter:
             task_list_message += f"\n筛选条件：任务名称包含 '{task_name_filter}'"
@@ -707,26 +861,42 @@ async def perform_delete(update: telegram.Update, context: telegram.ext.ContextT
     query = update.callback_query
     chat_id = query.message.chat_id
 
-    tasks = context.user_data.get("tasks", [])
-    session = context.user_data.get("session")
+    task_name_filter = context.user_data.get("task_name_filter", "")
     delete_cloud = context.user_data.get("delete_cloud", True)
 
+    listing = await get_task_listing(task_name_filter)
+    if listing is None:
+        await query.edit_message_text("❌ 获取任务列表失败，请稍后重试")
+        context.user_data.clear()
+        return ConversationHandler.END
+    names = listing.names
+    task_ids = [task_id for task_id in task_ids if task_id in names]
+    if not task_ids:
+        await query.edit_message_text("❌ 所选任务已不存在，请重新发送删除指令")
+        context.user_data.clear()
+        return ConversationHandler.END
+    total = len(task_ids)
     start_time = time.time()
-    deleted_count = 0
+    last_edit = start_time
+
+    async def on_progress(finished: int, failed: int):
+        # 限制编辑频率，避免触发 Telegram 限流；最后一次由结果消息覆盖
+        nonlocal last_edit
+        now = time.time()
+        if finished == total or now - last_edit < DELETE_PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await query.edit_message_text(f"🗑️ 正在删除任务：{finished}/{total}，失败 {failed}")
+        except telegram.error.TelegramError as e:
+            logger.warning("更新删除进度失败: %s", str(e))
+
+    await query.edit_message_text(f"🗑️ 正在删除 {total} 个任务（并发 {DELETE_CONCURRENCY}）...")
+    failures = await delete_tasks(get_async_client(), task_ids, delete_cloud, progress=on_progress)
+    deleted_count = total - len(failures)
     failed_tasks = []
-    
-    for task_id in task_ids:
-        task = next((t for t in tasks if str(t.get("id")) == task_id), None)
-        if not task:
-            continue
-        success, error_msg = delete_task_by_id(session, task_id, delete_cloud)
-        if success:
-            deleted_count += 1
-        else:
-            resource_name = task.get("resourceName", "")
-            share_folder_name = task.get("shareFolderName", "")
-            full_name = f"{resource_name}/{share_folder_name}" if share_folder_name else resource_name
-            failed_tasks.append(f"任务ID: {task_id}, 名称: {full_name}, 错误: {error_msg}")
+    for task_id in (task_id for task_id in task_ids if task_id in failures):
+        failed_tasks.append(f"任务ID: {task_id}, 名称: {names[task_id]}, 错误: {failures[task_id]}")
 
     duration = time.time() - start_time
 
@@ -735,6 +905,8 @@ async def perform_delete(update: telegram.Update, context: telegram.ext.ContextT
     feedback += f"⏱️ 用时：{duration:.2f} 秒\n"
     if failed_tasks:
         feedback += "⚠️ 以下任务删除失败：\n" + "\n".join(failed_tasks)
+    if len(feedback) > 4096:
+        feedback = feedback[:4093] + "..."
 
     await query.edit_message_text(feedback)
     context.user_data.clear()
@@ -747,11 +919,25 @@ async def timeout(update: telegram.Update, context: telegram.ext.ContextTypes.DE
     context.user_data.clear()
     return ConversationHandler.END
 
+async def post_init(application: Application):
+    """启动后台转存队列，恢复上次未完成的任务"""
+    global TRANSFER_QUEUE
+    TRANSFER_QUEUE = build_transfer_queue(application.bot)
+    await TRANSFER_QUEUE.start()
+
+async def post_shutdown(application: Application):
+    """停止后台转存队列，关闭 API 连接池，并等待后台数据库写入完成"""
+    if TRANSFER_QUEUE is not None:
+        await TRANSFER_QUEUE.stop()
+    await close_async_client()
+    await storage.flush()
+
 def main():
     """主函数，启动 Telegram 机器人"""
     init_db()
+    init_folder_db()
     load_default_folder()
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     conv_handler = ConversationHandler(
         entry_points=[
@@ -775,10 +961,12 @@ def main():
     )
 
     application.add_handler(conv_handler)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    application.add_handler(CommandHandler("save", save_command))
-    application.add_handler(CommandHandler("strm", strm_command))
-    application.add_handler(CommandHandler("execute", execute_command))
+    # 长耗时处理器设置 block=False，在后台运行，不阻塞其他更新的处理
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message, block=False))
+    application.add_handler(CommandHandler("save", save_command, block=False))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("txt"), link_file_handler, block=False))
+    application.add_handler(CommandHandler("strm", strm_command, block=False))
+    application.add_handler(CommandHandler("execute", execute_command, block=False))
 
     logger.info("机器人已启动，监听中...")
     application.run_polling(drop_pending_updates=True)